@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.urls import path
+
+from api import async_views
+
+urlpatterns = [
+    path('tags/', async_views.tag_list),
+    path('tags/<int:pk>/', async_views.tag_detail),
+]
+
+if settings.INGREDIENT_SEARCH_BACKEND == 'memory':
+    urlpatterns += [
+        path('ingredients/', async_views.ingredient_list),
+        path('ingredients/<int:pk>/', async_views.ingredient_detail),
+    ]
@@ -0,0 +1,98 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotAllowed, JsonResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.exceptions import NotFound
+
+from recipes.models import Tag
+from api.catalog import fresh_catalog, ingredient_catalog
+from api.filters import IngredientSearchFilter
+from api.mixins import make_etag
+from api.versions import get_versions, versions_shared
+
+SAFE = ('GET', 'HEAD')
+TAG_FIELDS = ('id', 'name', 'color', 'slug')
+
+
+def json_response(data, status=200):
+    return JsonResponse(
+        data, status=status, safe=False,
+        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')})
+
+
+def not_found():
+    return json_response({'detail': str(NotFound.default_detail)}, 404)
+
+
+async def read_versions(names):
+    """
+    Версии из кеша в памяти процесса (LocMemCache) читаются сразу:
+    сетевого обращения нет, переключение потока дороже самого
+    чтения. Общий кеш - через sync_to_async, не блокируя цикл событий.
+    """
+    if not versions_shared():
+        return get_versions(names)
+    return await sync_to_async(get_versions)(names)
+
+
+async def conditional(request, version, load):
+    """
+    Ответ с ETag / Last-Modified по версии данных (как у
+    ConditionalCacheMixin), при совпадении - 304 без загрузки данных.
+    load получает версию и возвращает ответ.
+    """
+    if request.method not in SAFE:
+        return HttpResponseNotAllowed(SAFE)
+    versions = await read_versions([version])
+    etag = make_etag([request.get_full_path(), 'json', *versions])
+    last_modified = versions[0] // 1000
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = await load(versions[0])
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    patch_vary_headers(response, ('Accept', 'Authorization'))
+    return response
+
+
+@sync_to_async
+def load_tags(pk=None):
+    tags = Tag.objects.order_by('id').values(*TAG_FIELDS)
+    if pk is None:
+        return json_response(list(tags))
+    tag = tags.filter(pk=pk).first()
+    return json_response(tag) if tag else not_found()
+
+
+async def tag_list(request):
+    return await conditional(request, 'tag', lambda version: load_tags())
+
+
+async def tag_detail(request, pk):
+    return await conditional(request, 'tag', lambda version: load_tags(pk))
+
+
+async def load_catalog(version):
+    """Снимок без переключения потока, если он уже актуален."""
+    return (fresh_catalog(version)
+            or await sync_to_async(ingredient_catalog)())
+
+
+async def ingredient_list(request):
+    """Каталог или автодополнение по ?name= из снимка в памяти."""
+    async def load(version):
+        catalog = await load_catalog(version)
+        name = request.GET.get(IngredientSearchFilter.search_param)
+        return json_response(
+            catalog.search(name) if name else catalog.catalog)
+    return await conditional(request, 'ingredient', load)
+
+
+async def ingredient_detail(request, pk):
+    async def load(version):
+        catalog = await load_catalog(version)
+        item = catalog.get(pk)
+        return json_response(item.as_dict()) if item else not_found()
+    return await conditional(request, 'ingredient', load)
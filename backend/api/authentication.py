@@ -0,0 +1,107 @@
+import copy
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+CACHE_KEY = 'auth_token:{}'
+
+
+def cache_key(key):
+    """Ключ кеша - хеш токена, сам токен в кеш не попадает."""
+    return CACHE_KEY.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+class LRUCache:
+    """Ограниченный по размеру кеш процесса со временем жизни записей."""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.items = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if not self.size or not self.timeout:
+            return
+        with self.lock:
+            self.items[key] = (value, time.monotonic() + self.timeout)
+            self.items.move_to_end(key)
+            while len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.items.pop(key, None)
+
+
+local_cache = LRUCache(settings.TOKEN_CACHE_LOCAL_SIZE,
+                       settings.TOKEN_CACHE_LOCAL_TIMEOUT)
+
+
+def snapshot(user):
+    """
+    Копия пользователя для кеша без хеша пароля: поле становится
+    отложенным и при обращении (смена пароля) читается из БД,
+    а save() такой копии пароль не перезаписывает.
+    """
+    user = copy.copy(user)
+    user.__dict__.pop('password', None)
+    return user
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication без запроса к БД на каждый запрос.
+    Снимок пользователя по токену хранится в общем кеше
+    (TOKEN_CACHE_TIMEOUT) и в LRU процесса
+    (TOKEN_CACHE_LOCAL_TIMEOUT), запись сбрасывается при удалении
+    токена (выход), сохранении и удалении пользователя (api.signals).
+    QuerySet.update() сигналов не вызывает: после массовой блокировки
+    User.objects.filter(...).update(is_active=False) снимки остаются
+    до TOKEN_CACHE_TIMEOUT, сбросить их - invalidate_user_tokens(pk).
+    """
+
+    def authenticate_credentials(self, key):
+        if not settings.TOKEN_CACHE_TIMEOUT:
+            return super().authenticate_credentials(key)
+        name = cache_key(key)
+        user = local_cache.get(name)
+        if user is None:
+            user = cache.get(name)
+            if user is None:
+                user, _ = super().authenticate_credentials(key)
+                user = snapshot(user)
+                cache.set(name, user, settings.TOKEN_CACHE_TIMEOUT)
+            local_cache.set(name, user)
+        user = copy.copy(user)
+        return user, Token(key=key, user=user)
+
+
+def invalidate_tokens(keys):
+    names = [cache_key(key) for key in keys]
+    local_cache.delete_many(names)
+    cache.delete_many(names)
+
+
+def invalidate_user_tokens(user_id):
+    invalidate_tokens(
+        Token.objects.filter(user_id=user_id).values_list('key', flat=True))
@@ -0,0 +1,5 @@
+"""
+Нагрузочные замеры API в процессе (manage.py benchmark).
+Данные генерируются в тестовой БД, запросы выполняются
+через тестовый клиент DRF без сети.
+"""
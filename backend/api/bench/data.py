@@ -0,0 +1,104 @@
+import csv
+import os
+import random
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from rest_framework.authtoken.models import Token
+
+from recipes.models import (Favorite, FeedItem, Follow, Ingredient,
+                            IngredientRecipe, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag, refresh_counters)
+from users.models import User
+
+DATA_DIR = os.path.join(os.path.dirname(settings.BASE_DIR), 'data')
+BATCH_SIZE = 1000
+
+
+def read_csv(name):
+    path = os.path.join(DATA_DIR, name)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as file:
+        return list(csv.reader(file))
+
+
+def load_catalog():
+    """Теги и ингредиенты из data/*.csv (или синтетические)."""
+    tags = read_csv('tags.csv') or [
+        ('Завтрак', '09db4f', 'breakfast'),
+        ('Обед', 'fa6a02', 'lunch'),
+        ('Ужин', 'b813d1', 'dinner')]
+    Tag.objects.bulk_create(
+        [Tag(name=name, color=color, slug=slug)
+         for name, color, slug in tags])
+    ingredients = read_csv('ingredients.csv') or [
+        (f'ингредиент {i}', 'г') for i in range(2000)]
+    Ingredient.objects.bulk_create(
+        [Ingredient(name=name, measurement_unit=unit)
+         for name, unit in ingredients],
+        batch_size=BATCH_SIZE)
+
+
+def generate(users=50, recipes=300, seed=0):
+    """
+    Синтетические пользователи, рецепты с 3-15 ингредиентами,
+    подписки, избранное и корзины. Возвращает список пользователей,
+    первый из них - «тяжёлый»: подписан на всех и с большой корзиной,
+    в корзине второго - все рецепты (тысячи строк состава).
+    """
+    rnd = random.Random(seed)
+    load_catalog()
+    tag_ids = list(Tag.objects.values_list('id', flat=True))
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+    password = make_password('benchmark-password')
+    User.objects.bulk_create([
+        User(username=f'bench{i}', email=f'bench{i}@example.com',
+             first_name='Имя', last_name='Фамилия', password=password)
+        for i in range(users)])
+    people = list(User.objects.order_by('id'))
+    Token.objects.bulk_create([
+        Token(key=f'{user.pk:040d}', user=user) for user in people])
+    Recipe.objects.bulk_create([
+        Recipe(author=rnd.choice(people), name=f'Рецепт {i}',
+               text='Описание приготовления. ' * rnd.randint(5, 40),
+               cooking_time=rnd.randint(5, 180), image='media/bench.png')
+        for i in range(recipes)], batch_size=BATCH_SIZE)
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+    IngredientRecipe.objects.bulk_create([
+        IngredientRecipe(recipe_id=recipe_id, ingredient_id=pk,
+                         amount=rnd.randint(1, 500))
+        for recipe_id in recipe_ids
+        for pk in rnd.sample(ingredient_ids, rnd.randint(3, 15))],
+        batch_size=BATCH_SIZE)
+    Recipe.tags.through.objects.bulk_create([
+        Recipe.tags.through(recipe_id=recipe_id, tag_id=pk)
+        for recipe_id in recipe_ids
+        for pk in rnd.sample(tag_ids, rnd.randint(1, len(tag_ids)))],
+        batch_size=BATCH_SIZE)
+    Recipe.objects.all().refresh_search_documents()
+    Recipe.objects.all().refresh_tags_masks()
+    heavy, others = people[0], people[1:]
+    Follow.objects.bulk_create(
+        [Follow(user=heavy, author=author) for author in others]
+        + [Follow(user=user, author=author)
+           for user in others
+           for author in rnd.sample(people, min(5, len(people)))
+           if author != user],
+        batch_size=BATCH_SIZE)
+    for model, share in ((Favorite, 0.3), (ShoppingCart, 0.1)):
+        model.objects.bulk_create([
+            model(author=user, recipe_id=recipe_id)
+            for user in people
+            for recipe_id in rnd.sample(
+                recipe_ids, int(len(recipe_ids) * share))],
+            batch_size=BATCH_SIZE)
+    ShoppingCart.objects.filter(author=people[1]).delete()
+    ShoppingCart.objects.bulk_create(
+        [ShoppingCart(author=people[1], recipe_id=recipe_id)
+         for recipe_id in recipe_ids],
+        batch_size=BATCH_SIZE)
+    ShoppingListItem.objects.rebuild()
+    refresh_counters()
+    FeedItem.objects.rebuild()
+    return people
@@ -0,0 +1,147 @@
+import math
+import time
+import tracemalloc
+from collections import namedtuple
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywa'
+    'AAAACVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQV'
+    'QImWNoAAAAggCByxOyYQAAAABJRU5ErkJggg==')
+
+Scenario = namedtuple('Scenario', 'name user method url body')
+
+
+def recipe_body(name, tags, ingredients, shift=0):
+    return {
+        'name': name, 'text': 'Замер', 'cooking_time': 10, 'image': IMAGE,
+        'tags': tags,
+        'ingredients': [
+            {'id': pk, 'amount': 10 + shift + i}
+            for i, pk in enumerate(ingredients)]}
+
+
+def build_scenarios(users):
+    """Сценарии замера; url и body могут зависеть от номера повтора."""
+    heavy = users[0]
+    tags = list(Tag.objects.order_by('id'))
+    ingredients = list(Ingredient.objects.order_by('id').values_list(
+        'id', flat=True)[:40])
+    recipe = Recipe.objects.order_by('id').first()
+    slugs = '&'.join(f'tags={tag.slug}' for tag in tags[:2])
+    feed_cursor = heavy.feed.order_by('recipe_id').values_list(
+        'recipe_id', flat=True)[20]
+    return [
+        Scenario('recipes_list', heavy, 'get', '/api/recipes/', None),
+        Scenario('recipes_list_tags', heavy, 'get',
+                 f'/api/recipes/?{slugs}', None),
+        Scenario('recipes_list_author', heavy, 'get',
+                 f'/api/recipes/?author={recipe.author_id}', None),
+        Scenario('recipes_list_favorited', heavy, 'get',
+                 '/api/recipes/?is_favorited=1', None),
+        Scenario('recipes_list_deep_page', heavy, 'get',
+                 '/api/recipes/?page=20&limit=10', None),
+        Scenario('recipes_list_popular', heavy, 'get',
+                 '/api/recipes/?ordering=popular', None),
+        Scenario('recipes_search', heavy, 'get',
+                 '/api/recipes/?search=рецепт сах', None),
+        Scenario('feed', heavy, 'get', '/api/recipes/feed/', None),
+        Scenario('feed_deep', heavy, 'get',
+                 f'/api/recipes/feed/?cursor={feed_cursor}', None),
+        Scenario('recipe_detail', heavy, 'get',
+                 f'/api/recipes/{recipe.pk}/', None),
+        Scenario('subscriptions', heavy, 'get',
+                 '/api/users/subscriptions/?recipes_limit=3', None),
+        Scenario('download_shopping_cart', heavy, 'get',
+                 '/api/recipes/download_shopping_cart/', None),
+        Scenario('download_shopping_cart_full', users[1], 'get',
+                 '/api/recipes/download_shopping_cart/', None),
+        Scenario('ingredient_search', heavy, 'get',
+                 '/api/ingredients/?name=сах', None),
+        Scenario('ingredient_list', heavy, 'get', '/api/ingredients/', None),
+        Scenario('ingredient_detail', heavy, 'get',
+                 f'/api/ingredients/{ingredients[0]}/', None),
+        Scenario('recipe_create', heavy, 'post', '/api/recipes/',
+                 lambda i: recipe_body(
+                     f'Замер {i}', [tags[0].pk],
+                     ingredients[i % 20:i % 20 + 10])),
+        Scenario('recipe_update', recipe.author, 'patch',
+                 f'/api/recipes/{recipe.pk}/',
+                 lambda i: recipe_body(
+                     recipe.name, [tags[i % len(tags)].pk],
+                     ingredients[i % 2:i % 2 + 10], shift=i % 3)),
+    ]
+
+
+def percentile(values, share):
+    ordered = sorted(values)
+    return ordered[max(math.ceil(share * len(ordered)) - 1, 0)]
+
+
+def send(client, scenario, i):
+    url = scenario.url(i) if callable(scenario.url) else scenario.url
+    body = scenario.body(i) if callable(scenario.body) else scenario.body
+    response = getattr(client, scenario.method)(url, body, format='json')
+    if response.status_code >= 400:
+        raise AssertionError(
+            f'{scenario.name}: {response.status_code} {response.content}')
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def measure(scenario, repeat):
+    """
+    Задержка p50 / p95 (мс), медиана SQL-запросов и пик выделенной
+    памяти (КиБ) на запрос.
+    """
+    client = APIClient()
+    client.force_authenticate(scenario.user)
+    timings, queries = [], []
+    for i in range(repeat):
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            send(client, scenario, i)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(len(context.captured_queries))
+    tracemalloc.start()
+    try:
+        send(client, scenario, repeat)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'p50_ms': round(percentile(timings, 0.5), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'queries': percentile(queries, 0.5),
+        'alloc_kib': round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, tolerance, min_delta=2.0):
+    """
+    Регрессии относительно сохранённого замера: больше SQL-запросов
+    или p95 выше базового более чем на tolerance (доля) и не меньше
+    чем на min_delta мс - разброс у быстрых запросов больше их времени.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['queries'] > base['queries']:
+            regressions.append(
+                f'{name}: SQL-запросов {result["queries"]} '
+                f'(было {base["queries"]})')
+        limit = max(base['p95_ms'] * (1 + tolerance),
+                    base['p95_ms'] + min_delta)
+        if result['p95_ms'] > limit:
+            regressions.append(
+                f'{name}: p95 {result["p95_ms"]} мс '
+                f'(было {base["p95_ms"]} мс)')
+    return regressions
@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from recipes.models import Recipe
+
+ASGI_URLCONF = 'foodgram.asgi_urls'
+
+
+def build_paths():
+    """Анонимные запросы на чтение для сравнения WSGI и ASGI."""
+    recipe = Recipe.objects.order_by('id').first()
+    return {
+        'tags_list': '/api/tags/',
+        'ingredient_search': '/api/ingredients/?name=сах',
+        'ingredient_catalog': '/api/ingredients/',
+        'recipes_list': '/api/recipes/',
+        'recipe_detail': f'/api/recipes/{recipe.pk}/',
+    }
+
+
+def check(path, response):
+    if response.status_code != 200:
+        raise AssertionError(f'{path}: {response.status_code}')
+
+
+def wsgi_rps(path, total):
+    """Запросов в секунду одного синхронного обработчика подряд."""
+    client = Client()
+    started = time.perf_counter()
+    for _ in range(total):
+        check(path, client.get(path))
+    return total / (time.perf_counter() - started)
+
+
+async def _asgi_rps(path, total, concurrency):
+    client = AsyncClient()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def request():
+        async with semaphore:
+            check(path, await client.get(path))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(request() for _ in range(total)))
+    return total / (time.perf_counter() - started)
+
+
+def asgi_rps(path, total, concurrency):
+    """Запросов в секунду одного цикла событий при concurrency клиентах."""
+    with override_settings(ROOT_URLCONF=ASGI_URLCONF):
+        return async_to_sync(_asgi_rps)(path, total, concurrency)
+
+
+def compare_protocols(total, concurrency):
+    results = {}
+    for name, path in build_paths().items():
+        wsgi = wsgi_rps(path, total)
+        asgi = asgi_rps(path, total, concurrency)
+        results[name] = {
+            'wsgi_rps': round(wsgi, 1),
+            'asgi_rps': round(asgi, 1),
+            'ratio': round(asgi / wsgi, 2),
+        }
+    return results
@@ -0,0 +1,162 @@
+import logging
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from threading import Lock
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from recipes.models import Ingredient
+from api.versions import get_version
+
+logger = logging.getLogger(__name__)
+
+VERSION_NAME = 'ingredient'
+# Без общего бэкенда кеша версии не видны другим процессам,
+# поэтому снимок в любом случае перестраивается раз в CATALOG_MAX_AGE секунд.
+CATALOG_MAX_AGE = 300
+
+
+class IngredientRecord:
+    """Ингредиент снимка каталога."""
+    __slots__ = ('id', 'name', 'measurement_unit')
+
+    def __init__(self, pk, name, measurement_unit):
+        self.id = pk
+        self.name = name
+        self.measurement_unit = measurement_unit
+
+    def as_dict(self):
+        return {'id': self.id, 'name': self.name,
+                'measurement_unit': self.measurement_unit}
+
+
+class IngredientCatalog:
+    """
+    Неизменяемый снимок каталога ингредиентов в памяти процесса:
+    параллельные массивы id (по возрастанию), названий и единиц.
+    Ингредиент по id ищется двоичным поиском. Для автодополнения -
+    номера строк в порядке названий: префикс ищется двоичным поиском,
+    вхождение - поиском подстроки.
+    Порядок выдачи: точное совпадение, префикс, вхождение.
+    """
+
+    def __init__(self, rows):
+        rows = sorted(rows)
+        self.ids = array('q', [pk for pk, name, unit in rows])
+        self.names = tuple(name for pk, name, unit in rows)
+        self.units = tuple(unit for pk, name, unit in rows)
+        self.order = array('l', sorted(
+            range(len(rows)),
+            key=lambda i: (self.names[i].lower(), self.ids[i])))
+        self.keys = [self.names[i].lower() for i in self.order]
+        # Все названия одной строкой: вхождения ищутся str.find,
+        # номер названия - двоичным поиском по смещениям.
+        self.text = '\n'.join(self.keys)
+        self.offsets = array('l')
+        offset = 0
+        for key in self.keys:
+            self.offsets.append(offset)
+            offset += len(key) + 1
+        self._catalog = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def position(self, pk):
+        i = bisect_left(self.ids, pk)
+        return i if i < len(self.ids) and self.ids[i] == pk else None
+
+    def record(self, i):
+        return IngredientRecord(self.ids[i], self.names[i], self.units[i])
+
+    def get(self, pk):
+        i = self.position(pk)
+        return None if i is None else self.record(i)
+
+    def in_bulk(self, ids):
+        """{id: IngredientRecord} найденных, как QuerySet.in_bulk."""
+        found = {}
+        for pk in ids:
+            i = self.position(pk)
+            if i is not None:
+                found[pk] = self.record(i)
+        return found
+
+    @property
+    def catalog(self):
+        """Весь каталог по возрастанию id, строится при первом обращении."""
+        if self._catalog is None:
+            self._catalog = [self.record(i).as_dict()
+                             for i in range(len(self.ids))]
+        return self._catalog
+
+    def find_contains(self, query, prefixed):
+        found = {}
+        position = self.text.find(query)
+        while position != -1:
+            i = bisect_right(self.offsets, position) - 1
+            if i not in prefixed:
+                found.setdefault(i, (position - self.offsets[i], self.keys[i]))
+            position = self.text.find(query, position + 1)
+        return sorted(found, key=found.get)
+
+    def search(self, query, limit=None):
+        query = query.strip().lower()
+        if not query:
+            return []
+        start = bisect_left(self.keys, query)
+        end = bisect_left(self.keys, query + '\uffff', start)
+        prefixed = range(start, end)
+        exact = [i for i in prefixed if self.keys[i] == query]
+        prefix = [i for i in prefixed if self.keys[i] != query]
+        found = exact + prefix + self.find_contains(query, prefixed)
+        return [self.record(self.order[i]).as_dict() for i in found[:limit]]
+
+
+_lock = Lock()
+_catalog = None
+_catalog_version = None
+_catalog_built = 0
+
+
+def _is_stale(version):
+    return (_catalog is None or _catalog_version != version
+            or time.monotonic() - _catalog_built > CATALOG_MAX_AGE)
+
+
+def fresh_catalog(version):
+    """Уже построенный снимок указанной версии или None, без обращения к БД."""
+    return None if _is_stale(version) else _catalog
+
+
+def ingredient_catalog():
+    """
+    Снимок текущей версии каталога ингредиентов.
+    Перестраивается при изменении Ingredient (см. api.signals).
+    """
+    global _catalog, _catalog_version, _catalog_built
+    version = get_version(VERSION_NAME)
+    if _is_stale(version):
+        with _lock:
+            if _is_stale(version):
+                _catalog = IngredientCatalog(Ingredient.objects.values_list(
+                    'id', 'name', 'measurement_unit'))
+                _catalog_version = version
+                _catalog_built = time.monotonic()
+    return _catalog
+
+
+def preload_catalog():
+    """
+    Загрузка снимка при старте процесса (wsgi / asgi), чтобы первый
+    запрос не ждал её. Без БД (сборка образа, до миграций) - пропуск.
+    """
+    if settings.INGREDIENT_SEARCH_BACKEND != 'memory':
+        return
+    try:
+        ingredient_catalog()
+    except DatabaseError:
+        logger.warning('Каталог ингредиентов не загружен при старте',
+                       exc_info=True)
@@ -0,0 +1,157 @@
+import base64
+import binascii
+import uuid
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from PIL import Image
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+
+# Сигнатуры допустимых форматов: (смещение, байты) -> расширение.
+SIGNATURES = (
+    ((0, b'\x89PNG\r\n\x1a\n'), 'png'),
+    ((0, b'\xff\xd8\xff'), 'jpg'),
+    ((0, b'GIF87a'), 'gif'),
+    ((0, b'GIF89a'), 'gif'),
+    ((8, b'WEBP'), 'webp'),
+)
+FORMATS = {'PNG': 'png', 'JPEG': 'jpg', 'GIF': 'gif', 'WEBP': 'webp'}
+# Кратно 4 символам base64: куски декодируются независимо.
+CHUNK_CHARS = 4 * 16 * 1024
+HEAD_SIZE = 16
+
+
+class PayloadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Слишком большой запрос.'
+    default_code = 'payload_too_large'
+
+
+def check_upload_size(request):
+    """
+    Отказ по заголовку Content-Length до чтения тела запроса:
+    изображение в base64 на треть больше файла, плюс остальные поля.
+    """
+    limit = (settings.RECIPE_IMAGE_MAX_SIZE * 4 // 3
+             + settings.RECIPE_UPLOAD_OVERHEAD)
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if length > limit:
+        raise PayloadTooLarge(
+            f'Размер запроса больше допустимого ({limit} байт).')
+
+
+def sniff(head):
+    """Расширение по сигнатуре первых байтов файла или None."""
+    for (offset, signature), extension in SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            return extension
+    return None
+
+
+class StreamingImageField(serializers.ImageField):
+    """
+    Изображение строкой base64 (data:image/...;base64,...) или файлом
+    multipart/form-data. Строка base64 уже целиком в памяти - её
+    прочитал разбор тела запроса; кусками во временный файл
+    (в памяти до FILE_UPLOAD_MAX_MEMORY_SIZE, дальше на диске)
+    декодируются только байты изображения. Размер проверяется по длине
+    строки до декодирования, формат - по первым байтам, изображение
+    целиком Pillow не декодирует (только verify). При ошибке временный
+    файл закрывается.
+    """
+    default_error_messages = {
+        'invalid_base64': 'Некорректные данные base64.',
+        'too_large': 'Размер изображения больше {limit} байт.',
+        'not_image': 'Загрузите изображение PNG, JPEG, GIF или WebP.',
+        'too_many_pixels': 'Изображение больше {limit} пикселей.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            file = self.decode(data)
+            try:
+                return self.check_file(file)
+            except Exception:
+                file.close()
+                raise
+        if hasattr(data, 'read') and hasattr(data, 'size'):
+            self.check_size(data.size)
+            return self.check_file(data)
+        self.fail('invalid')
+
+    def check_file(self, file):
+        head = file.read(HEAD_SIZE)
+        file.seek(0)
+        extension = sniff(head)
+        if extension is None:
+            self.fail('not_image')
+        self.verify(file, extension)
+        file.seek(0)
+        return UploadedFile(
+            file, name=f'{uuid.uuid4()}.{extension}',
+            content_type=f'image/{extension}', size=file.size)
+
+    def check_size(self, size):
+        limit = settings.RECIPE_IMAGE_MAX_SIZE
+        if size > limit:
+            self.fail('too_large', limit=limit)
+
+    def decode(self, data):
+        # Строка не копируется: заголовок data:...;base64, пропускается
+        # смещением, куски берутся срезами исходной строки.
+        marker = data.find(';base64,')
+        start = 0 if marker == -1 else marker + len(';base64,')
+        padding = len(data[-2:]) - len(data[-2:].rstrip('='))
+        self.check_size((len(data) - start) * 3 // 4 - padding)
+        file = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        size = 0
+        try:
+            for offset in range(start, len(data), CHUNK_CHARS):
+                chunk = base64.b64decode(
+                    data[offset:offset + CHUNK_CHARS], validate=True)
+                if offset == start and sniff(chunk[:HEAD_SIZE]) is None:
+                    self.fail('not_image')
+                size += file.write(chunk)
+        except binascii.Error:
+            file.close()
+            self.fail('invalid_base64')
+        except Exception:
+            file.close()
+            raise
+        file.size = size
+        file.seek(0)
+        return file
+
+    def verify(self, file, extension):
+        try:
+            with Image.open(file) as image:
+                if FORMATS.get(image.format) != extension:
+                    self.fail('not_image')
+                width, height = image.size
+                limit = settings.RECIPE_IMAGE_MAX_PIXELS
+                if width * height > limit:
+                    self.fail('too_many_pixels', limit=limit)
+                image.verify()
+        except (OSError, SyntaxError, ValueError,
+                Image.DecompressionBombError):
+            self.fail('invalid_image')
+
+
+class RenditionField(serializers.ImageField):
+    """
+    Уменьшенная копия изображения рецепта (recipes.images).
+    Пока копия не готова, отдаётся оригинал.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        return super().get_attribute(instance) or instance.image
@@ -1,12 +1,30 @@
+from django.db.models import Case, IntegerField, Value, When
 from django_filters.rest_framework import FilterSet, filters
 from rest_framework.filters import SearchFilter
 
 from recipes.models import Recipe, User, Tag
+from api.search import search_recipes
 
 
 class IngredientSearchFilter(SearchFilter):
+    """
+    Поиск ингредиентов по названию средствами БД:
+    точное совпадение, затем префикс, затем вхождение.
+    """
     search_param = 'name'
 
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return queryset.filter(name__icontains=query).annotate(
+            rank=Case(
+                When(name__iexact=query, then=Value(0)),
+                When(name__istartswith=query, then=Value(1)),
+                default=Value(2),
+                output_field=IntegerField())
+        ).order_by('rank', 'name')
+
 
 class RecipeFilter(FilterSet):
     author = filters.ModelChoiceFilter(
@@ -15,15 +33,27 @@ class RecipeFilter(FilterSet):
         field_name='tags__slug',
         to_field_name='slug',
         queryset=Tag.objects.all(),
+        method='filter_tags',
     )
     is_in_shopping_cart = filters.NumberFilter(
         method='filter_is_in_shopping_cart')
     is_favorited = filters.NumberFilter(
         method='filter_is_favorited')
+    search = filters.CharFilter(
+        method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'Сначала популярные'),),
+        method='filter_ordering')
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search', 'ordering')
+
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.with_any_tag(value)
 
     def filter_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
@@ -34,3 +64,11 @@ class RecipeFilter(FilterSet):
         if self.request.user.is_authenticated and value:
             return queryset.filter(shopping_cart__author=self.request.user)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        """Поиск по названию, описанию и ингредиентам с ранжированием."""
+        return search_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        """По числу добавлений в избранное - по счётчику, без агрегации."""
+        return queryset.order_by('-favorites_count', '-id')
@@ -0,0 +1,129 @@
+import json
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+
+from api.bench import data, runner, throughput
+from recipes.images import wait_pending
+
+BASELINE = os.path.join(os.path.dirname(runner.__file__), 'baseline.json')
+
+
+class Command(BaseCommand):
+    """
+    Замер задержки, числа SQL-запросов и выделений памяти основных
+    эндпоинтов API на синтетических данных в тестовой БД.
+    Результат сравнивается с сохранённым базовым замером.
+    """
+    help = 'Нагрузочный замер API со сравнением с базовым замером.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=300)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--scenario', action='append',
+            help='Запустить только указанные сценарии.')
+        parser.add_argument('--baseline', default=BASELINE)
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Сохранить результат как базовый замер.')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.5,
+            help='Допустимый рост p95 относительно базового, доля.')
+        parser.add_argument(
+            '--warm-cache', action='store_true',
+            help='Использовать кеш ответов (по умолчанию замеряется '
+                 'обработка без кеша).')
+        parser.add_argument(
+            '--asgi', action='store_true',
+            help='Сравнить запросы в секунду под WSGI и ASGI.')
+        parser.add_argument(
+            '--concurrency', type=int, default=20,
+            help='Одновременных клиентов в режиме ASGI.')
+
+    def handle(self, *args, **options):
+        caches = dict(settings.CACHES, uncached={
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache'})
+        alias = 'default' if options['warm_cache'] else 'uncached'
+        with tempfile.TemporaryDirectory() as media, override_settings(
+                MEDIA_ROOT=media, CACHES=caches, RESPONSE_CACHE_ALIAS=alias):
+            results = self.run_in_test_db(options, media)
+        self.report(results, options)
+
+    def run_in_test_db(self, options, workdir):
+        """
+        Замер во временной тестовой БД. SQLite - в файле, а не в памяти:
+        фоновые потоки (обработка изображений) иначе упираются
+        в блокировки общей памяти.
+        """
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        if connection.vendor == 'sqlite':
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                workdir, 'benchmark.sqlite3')
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = self.run(options)
+            if options['asgi']:
+                self.compare_protocols(options)
+            wait_pending()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        return results
+
+    def run(self, options):
+        users = data.generate(
+            users=options['users'], recipes=options['recipes'],
+            seed=options['seed'])
+        results = {}
+        for scenario in runner.build_scenarios(users):
+            if options['scenario'] and (
+                    scenario.name not in options['scenario']):
+                continue
+            results[scenario.name] = runner.measure(
+                scenario, options['repeat'])
+            self.stdout.write(
+                f'{scenario.name:<28}'
+                + '  '.join(f'{key}={value}' for key, value
+                            in results[scenario.name].items()))
+        return results
+
+    def compare_protocols(self, options):
+        total = options['repeat'] * 10
+        results = throughput.compare_protocols(total, options['concurrency'])
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<28}'
+                + '  '.join(f'{key}={value}' for key, value
+                            in result.items()))
+
+    def report(self, results, options):
+        path = options['baseline']
+        if options['save_baseline']:
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+                file.write('\n')
+            self.stdout.write(self.style.SUCCESS(
+                f'Базовый замер сохранён в {path}.'))
+            return
+        if not os.path.exists(path):
+            self.stdout.write(f'Базовый замер {path} не найден.')
+            return
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = runner.compare(results, baseline, options['tolerance'])
+        for line in regressions:
+            self.stdout.write(self.style.ERROR(line))
+        if regressions:
+            raise CommandError(f'Регрессий: {len(regressions)}.')
+        self.stdout.write(self.style.SUCCESS(
+            'Регрессий относительно базового замера нет.'))
@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from recipes.models import Favorite, Follow, ShoppingCart
+from api.versions import bump_version
+
+CACHE_KEY = 'membership:{}:{}'
+KINDS = {
+    'favorites': (Favorite, 'author', 'recipe_id'),
+    'shopping_cart': (ShoppingCart, 'author', 'recipe_id'),
+    'following': (Follow, 'user', 'author_id'),
+}
+
+
+class UserMembership:
+    """
+    Множества id избранных рецептов, рецептов в корзине
+    и авторов, на которых подписан пользователь.
+    Каждое множество загружается одним запросом при первом обращении,
+    проверка флагов в сериализаторах - поиск по множеству.
+    """
+
+    def __init__(self, user=None):
+        self.user = user
+
+    def __getattr__(self, kind):
+        if kind not in KINDS:
+            raise AttributeError(kind)
+        value = self.load(kind) if self.user else frozenset()
+        setattr(self, kind, value)
+        return value
+
+    def load(self, kind):
+        timeout = settings.MEMBERSHIP_CACHE_TIMEOUT
+        key = CACHE_KEY.format(self.user.pk, kind)
+        if timeout:
+            value = cache.get(key)
+            if value is not None:
+                return value
+        model, owner, field = KINDS[kind]
+        value = frozenset(model.objects.filter(
+            **{owner: self.user}).values_list(field, flat=True))
+        if timeout:
+            cache.set(key, value, timeout)
+        return value
+
+
+EMPTY = UserMembership()
+
+
+def get_membership(request):
+    """
+    Членство текущего пользователя, закешированное на время запроса.
+    При MEMBERSHIP_CACHE_TIMEOUT > 0 дополнительно хранится в кеше
+    между запросами (имеет смысл только с общим бэкендом кеша).
+    """
+    if request is None or request.user.is_anonymous:
+        return EMPTY
+    membership = getattr(request, '_membership', None)
+    if membership is None:
+        membership = request._membership = UserMembership(request.user)
+    return membership
+
+
+def invalidate_membership(request=None, user=None):
+    """Сброс членства после изменения избранного, корзины или подписок."""
+    if request is not None:
+        request._membership = None
+        user = request.user
+    cache.delete_many([CACHE_KEY.format(user.pk, kind) for kind in KINDS])
+    bump_version(f'membership:{user.pk}')
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from threading import Lock
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = (
+    ('requests_total', 'Количество запросов.'),
+    ('db_queries_total', 'Количество SQL-запросов.'),
+    ('db_seconds_total', 'Время выполнения SQL, с.'),
+    ('serializer_seconds_total', 'Время сериализации ответа, с.'),
+    ('request_seconds_total', 'Время обработки запроса, с.'),
+    ('response_bytes_total', 'Размер тел ответов, байт.'),
+    ('query_budget_exceeded_total', 'Превышения бюджета SQL-запросов.'),
+)
+
+
+class QueryBudgetExceeded(Exception):
+    """Действие выполнило больше SQL-запросов, чем задано в QUERY_BUDGETS."""
+
+
+class RequestMetrics:
+    """Показатели одного запроса."""
+
+    def __init__(self, count_queries=True):
+        self.label = 'unresolved'
+        self.count_queries = count_queries
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.total_time = 0.0
+        self.size = 0
+        self.started = time.perf_counter()
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += time.perf_counter() - started
+
+    def timed_serializer(self, to_representation):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return to_representation(*args, **kwargs)
+            finally:
+                self.serializer_time += time.perf_counter() - started
+        return wrapper
+
+    def finish(self, response):
+        self.total_time = time.perf_counter() - self.started
+        if not response.streaming:
+            self.size = len(response.content)
+
+    def server_timing(self):
+        parts = [f'serializer;dur={self.serializer_time * 1000:.1f}',
+                 f'total;dur={self.total_time * 1000:.1f}']
+        if self.count_queries:
+            parts.insert(0, f'db;dur={self.sql_time * 1000:.1f};'
+                            f'desc="{self.queries} queries"')
+        return ', '.join(parts)
+
+
+class MetricsRegistry:
+    """Накопленные показатели по действиям вьюсетов в памяти процесса."""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.values = defaultdict(lambda: defaultdict(float))
+
+    def record(self, metrics, budget_exceeded=False):
+        with self.lock:
+            values = self.values[metrics.label]
+            values['requests_total'] += 1
+            values['db_queries_total'] += metrics.queries
+            values['db_seconds_total'] += metrics.sql_time
+            values['serializer_seconds_total'] += metrics.serializer_time
+            values['request_seconds_total'] += metrics.total_time
+            values['response_bytes_total'] += metrics.size
+            values['query_budget_exceeded_total'] += budget_exceeded
+
+    def render(self):
+        """Текстовый формат экспозиции Prometheus."""
+        with self.lock:
+            values = {label: dict(counters)
+                      for label, counters in self.values.items()}
+        lines = []
+        for name, description in COUNTERS:
+            lines.append(f'# HELP foodgram_{name} {description}')
+            lines.append(f'# TYPE foodgram_{name} counter')
+            for label, counters in sorted(values.items()):
+                lines.append(
+                    f'foodgram_{name}{{view="{label}"}} '
+                    f'{counters.get(name, 0):g}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def view_label(view_func, method):
+    """Имя действия вьюсета DRF вида RecipeViewSet.list."""
+    cls = getattr(view_func, 'cls', None)
+    if cls is None:
+        return getattr(view_func, '__name__', 'unknown')
+    actions = getattr(view_func, 'actions', None) or {}
+    action = actions.get(method.lower(), method.lower())
+    return f'{cls.__name__}.{action}'
+
+
+def check_budget(metrics):
+    if not metrics.count_queries:
+        return False
+    budget = settings.QUERY_BUDGETS.get(metrics.label)
+    if budget is None or metrics.queries <= budget:
+        return False
+    message = (f'{metrics.label}: {metrics.queries} SQL-запросов '
+               f'при бюджете {budget}')
+    if settings.QUERY_BUDGET_STRICT:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+    return True
+
+
+def show_server_timing(request):
+    """
+    Пользователь берётся после обработки: DRF записывает
+    аутентифицированного по токену в исходный запрос.
+    """
+    user = getattr(request, 'user', None)
+    return settings.DEBUG or bool(user and user.is_staff)
+
+
+class MetricsMiddleware:
+    """
+    Считает SQL-запросы и время обработки каждого запроса,
+    копит их в registry и отдаёт в заголовке Server-Timing -
+    только при DEBUG или сотруднику (is_staff).
+    Под ASGI SQL-запросы не считаются: синхронный код выполняется
+    в общем потоке sync_to_async, где обёртки соединений разных
+    запросов смешались бы.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        metrics = request.metrics = RequestMetrics()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(metrics.execute_wrapper))
+            response = self.get_response(request)
+        return self.record(request, metrics, response)
+
+    async def __acall__(self, request):
+        metrics = request.metrics = RequestMetrics(count_queries=False)
+        response = await self.get_response(request)
+        return self.record(request, metrics, response)
+
+    def record(self, request, metrics, response):
+        metrics.finish(response)
+        if show_server_timing(request):
+            response['Server-Timing'] = metrics.server_timing()
+        try:
+            exceeded = check_budget(metrics)
+        except QueryBudgetExceeded:
+            registry.record(metrics, budget_exceeded=True)
+            raise
+        registry.record(metrics, budget_exceeded=exceeded)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics.label = view_label(view_func, request.method)
@@ -0,0 +1,101 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from api.versions import get_versions
+
+
+def make_etag(parts):
+    """ETag ответа из адреса, формата и версий данных."""
+    digest = hashlib.sha1('|'.join(map(str, parts)).encode())
+    return quote_etag(digest.hexdigest())
+
+
+class ConditionalCacheMixin:
+    """
+    Условные GET и кеш сериализованных ответов для list / retrieve.
+    ETag строится из версий данных (api.versions), от которых зависит
+    ответ: при совпадении If-None-Match / If-Modified-Since отдаётся 304,
+    иначе данные берутся из кеша RESPONSE_CACHE_ALIAS или считаются заново
+    (без кеша, если use_response_cache() ложно).
+    """
+    cache_actions = ('list', 'retrieve')
+    cache_versions = ()
+    cache_per_user = False
+
+    def get_cache_versions(self):
+        return list(self.cache_versions)
+
+    def use_response_cache(self):
+        return True
+
+    def get_etag(self, request, versions):
+        parts = [request.get_full_path(), request.accepted_renderer.format]
+        if self.cache_per_user:
+            parts.append(request.user.pk)
+        parts.extend(versions)
+        return make_etag(parts)
+
+    def load_response(self, etag, handler, request, *args, **kwargs):
+        if not self.use_response_cache():
+            return handler(request, *args, **kwargs)
+        cache = caches[settings.RESPONSE_CACHE_ALIAS]
+        key = f'response:{etag}'
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        return response
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        versions = get_versions(self.get_cache_versions())
+        etag = self.get_etag(request, versions)
+        last_modified = max(versions, default=0) // 1000 or None
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.load_response(
+                etag, handler, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if 'list' not in self.cache_actions:
+            return super().list(request, *args, **kwargs)
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if 'retrieve' not in self.cache_actions:
+            return super().retrieve(request, *args, **kwargs)
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+
+class MetricsMixin:
+    """
+    Учёт времени сериализации ответа в показателях запроса
+    (см. api.metrics.MetricsMiddleware).
+    """
+
+    def instrument_serializer(self, serializer):
+        metrics = getattr(self.request._request, 'metrics', None)
+        if metrics is not None:
+            serializer.to_representation = metrics.timed_serializer(
+                serializer.to_representation)
+        return serializer
+
+    def get_serializer(self, *args, **kwargs):
+        return self.instrument_serializer(
+            super().get_serializer(*args, **kwargs))
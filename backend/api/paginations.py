@@ -1,6 +1,196 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from collections import OrderedDict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (BasePagination, Cursor,
+                                       CursorPagination, PageNumberPagination)
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def _invert(item):
+    return item[1:] if item.startswith('-') else '-' + item
+
+
+def keyset_after(ordering, position):
+    """
+    Строки после ключа position в порядке ordering:
+    (a, b) > (x, y) - это a > x OR (a = x AND b > y).
+    """
+    condition = Q()
+    equal = {}
+    for item, value in zip(ordering, position):
+        name = item.lstrip('-')
+        lookup = 'lt' if item.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+    return condition
+
+
+def field_ordering(queryset):
+    """
+    Порядок запроса, если он задан только полями модели
+    (ключ курсора), иначе None: ранг поиска, выражения.
+    """
+    opts = queryset.model._meta
+    names = {'pk'} | {name for field in opts.concrete_fields
+                      for name in (field.name, field.attname)}
+    ordering = tuple(queryset.query.order_by)
+    if all(isinstance(item, str) and item.lstrip('-') in names
+           for item in ordering):
+        return ordering
+    return None
+
+
+class ApiCursorPagination(CursorPagination):
+    """
+    Постраничный вывод по ключу (keyset): WHERE id < X ORDER BY -id.
+    Без OFFSET и COUNT(*), время ответа не зависит от глубины страницы.
+    Заданный запросом порядок по полям (?ordering=popular) сохраняется,
+    ключ курсора - все поля порядка с id в конце, он уникален:
+    повторы favorites_count не сдвигают страницы.
+    """
+    ordering = '-id'
+    page_size_query_param = "limit"
+    page_size = 6
+
+    def get_ordering(self, request, queryset, view):
+        ordering = field_ordering(queryset) or (self.ordering,)
+        if not {'id', 'pk'} & {item.lstrip('-') for item in ordering}:
+            ordering += ('-id',)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(_invert(item) for item in ordering)
+        queryset = queryset.order_by(*ordering)
+        position = self.get_position()
+        if position is not None:
+            queryset = queryset.filter(keyset_after(ordering, position))
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+        self.has_next = following or reverse
+        self.has_previous = following if reverse else position is not None
+        return self.page
+
+    def get_position(self):
+        """Значения ключа из курсора: JSON-список по полям порядка."""
+        if self.cursor is None or self.cursor.position is None:
+            return None
+        try:
+            position = json.loads(self.cursor.position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or (
+                len(position) != len(self.ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_position(self, instance, reverse):
+        position = json.dumps(
+            [getattr(instance, item.lstrip('-')) for item in self.ordering],
+            cls=DjangoJSONEncoder, separators=(',', ':'))
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=reverse, position=position))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_position(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_position(self.page[0], reverse=True)
 
 
 class ApiPagination(PageNumberPagination):
+    """
+    Постраничный вывод по номеру страницы (?page=, ?limit=).
+    Параметр ?cursor= (для первой страницы - пустой) включает
+    вывод по ключу, ссылки next / previous содержат курсор.
+    Порядок не по полям (ранг поиска) ключом быть не может,
+    такие результаты выводятся по номеру страницы.
+    """
     page_size_query_param = "limit"
     page_size = 6
+    cursor_query_param = 'cursor'
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (self.cursor_query_param in request.query_params
+                and field_ordering(queryset) is not None):
+            self.keyset = ApiCursorPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class FeedPagination(BasePagination):
+    """
+    Вывод ленты подписок по ключу: ?cursor= - id последнего рецепта
+    предыдущей страницы (из ссылки next), ?limit= - размер страницы,
+    не больше max_page_size.
+    """
+    page_size = 6
+    max_page_size = 100
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    request = None
+    next_cursor = None
+
+    def get_page_size(self, request):
+        value = request.query_params.get(self.page_size_query_param, '')
+        if value.isdigit() and int(value) > 0:
+            return min(int(value), self.max_page_size)
+        return self.page_size
+
+    def get_cursor(self, request):
+        value = request.query_params.get(self.cursor_query_param)
+        if not value:
+            return None
+        if not value.isdigit():
+            raise NotFound(CursorPagination.invalid_cursor_message)
+        return int(value)
+
+    def paginate_ids(self, page_ids, request):
+        """
+        page_ids(before, size) отдаёт id по убыванию; на один больше
+        размера страницы - чтобы узнать, есть ли следующая.
+        """
+        self.request = request
+        size = self.get_page_size(request)
+        ids = page_ids(self.get_cursor(request), size + 1)
+        if len(ids) > size:
+            self.next_cursor = ids[size - 1]
+        return ids[:size]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
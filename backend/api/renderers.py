@@ -0,0 +1,26 @@
+from django.utils.encoding import force_str
+from rest_framework import renderers
+
+
+class PlainTextRenderer(renderers.BaseRenderer):
+    """
+    Рендерер для выгрузок в текстовом виде.
+    Тело потоковых ответов формирует сам обработчик,
+    здесь отрисовываются только сообщения об ошибках.
+    """
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, dict):
+            data = '\n'.join(force_str(value) for value in data.values())
+        return force_str(data).encode(self.charset)
+
+
+class CSVRenderer(PlainTextRenderer):
+    """Рендерер для выгрузок в формате CSV."""
+    media_type = 'text/csv'
+    format = 'csv'
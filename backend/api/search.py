@@ -0,0 +1,186 @@
+import re
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from threading import Lock
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import IntegerField
+from django.db.models.expressions import RawSQL
+
+from recipes.models import Recipe
+from api.versions import bump_version, get_version
+
+VERSION_NAME = 'recipe_search'
+INDEX_MAX_AGE = 300
+# Конфигурация и выражение - как в индексе миграции recipes 0006.
+CONFIG = 'russian'
+# Вес слова по строке search_document: название, ингредиенты, описание.
+LINE_WEIGHTS = (3, 2, 1)
+WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return WORD.findall(text.lower().replace('ё', 'е'))
+
+
+def document_weights(document):
+    """Слова документа с суммой весов их вхождений."""
+    weights = defaultdict(int)
+    for line, weight in zip(document.split('\n', 2), LINE_WEIGHTS):
+        for word in tokenize(line):
+            weights[word] += weight
+    return weights
+
+
+class RecipeSearchIndex:
+    """
+    Обратный индекс рецептов в памяти процесса - замена
+    полнотекстовому поиску PostgreSQL для остальных СУБД.
+    Слово запроса совпадает со словами документа, которые с него
+    начинаются; нужны все слова запроса. Ранг - сумма весов совпадений.
+    Изменённый документ обновляется на месте (update / remove):
+    словарь слова заменяется копией, поиск в других потоках
+    читает прежний.
+    """
+
+    def __init__(self, rows):
+        postings = defaultdict(dict)
+        self.words = {}
+        for pk, document in rows:
+            weights = document_weights(document)
+            for word, weight in weights.items():
+                postings[word][pk] = weight
+            self.words[pk] = tuple(weights)
+        self.postings = dict(postings)
+        self.terms = sorted(postings)
+
+    def update(self, pk, document):
+        self.remove(pk)
+        weights = document_weights(document)
+        for word, weight in weights.items():
+            if word not in self.postings:
+                self.postings[word] = {}
+                insort(self.terms, word)
+            self.postings[word] = {**self.postings[word], pk: weight}
+        self.words[pk] = tuple(weights)
+
+    def remove(self, pk):
+        for word in self.words.pop(pk, ()):
+            postings = dict(self.postings[word])
+            postings.pop(pk, None)
+            self.postings[word] = postings
+
+    def match(self, word):
+        scores = defaultdict(int)
+        start = bisect_left(self.terms, word)
+        end = bisect_left(self.terms, word + '\uffff', start)
+        for term in self.terms[start:end]:
+            for pk, weight in self.postings[term].items():
+                scores[pk] += weight
+        return scores
+
+    def scores(self, query):
+        """Ранг каждого подходящего рецепта: {id: ранг}, все совпадения."""
+        total = None
+        for word in set(tokenize(query)):
+            scores = self.match(word)
+            if total is None:
+                total = scores
+            else:
+                total = {pk: score + scores[pk]
+                         for pk, score in total.items() if pk in scores}
+            if not total:
+                return {}
+        return dict(total or {})
+
+
+_lock = Lock()
+_index = None
+_index_version = None
+_index_built = 0
+
+
+def _is_stale(version):
+    return (_index is None or _index_version != version
+            or time.monotonic() - _index_built > INDEX_MAX_AGE)
+
+
+def recipe_search_index():
+    """Индекс текущей версии поисковых документов (см. api.signals)."""
+    global _index, _index_version, _index_built
+    version = get_version(VERSION_NAME)
+    if _is_stale(version):
+        with _lock:
+            if _is_stale(version):
+                _index = RecipeSearchIndex(
+                    Recipe.objects.values_list('id', 'search_document')
+                    .iterator())
+                _index_version = version
+                _index_built = time.monotonic()
+    return _index
+
+
+def update_search_index(pk, document=None):
+    """
+    Документ рецепта изменён (None - рецепт удалён): новая версия
+    поиска. Индекс этого процесса, если он был актуален, обновляется
+    на месте и остаётся актуальным; другие процессы по новой версии
+    перестраивают свой.
+    """
+    global _index_version
+    with _lock:
+        current = (_index is not None
+                   and _index_version == get_version(VERSION_NAME))
+        version = bump_version(VERSION_NAME)
+        if not current:
+            return
+        if document is None:
+            _index.remove(pk)
+        else:
+            _index.update(pk, document)
+        _index_version = version
+
+
+def search_recipes(queryset, query):
+    """
+    Рецепты, подходящие под запрос, по убыванию релевантности.
+    PostgreSQL: to_tsvector(search_document) @@ websearch_to_tsquery
+    по GIN-индексу, ранг ts_rank; иначе - индекс в памяти.
+    """
+    query = query.strip()
+    if not query:
+        return queryset
+    if connection.vendor == 'postgresql':
+        vector = SearchVector('search_document', config=CONFIG)
+        search = SearchQuery(query, config=CONFIG, search_type='websearch')
+        return queryset.annotate(
+            search_vector=vector,
+            search_rank=SearchRank(vector, search),
+        ).filter(search_vector=search).order_by('-search_rank', '-id')
+    scores = recipe_search_index().scores(query)
+    if not scores:
+        return queryset.none()
+    return queryset.alias(search_rank=rank_order(scores)).filter(
+        search_rank__isnull=False).order_by('search_rank', '-id')
+
+
+def rank_order(scores):
+    """
+    Позиция группы рецептов с равным рангом, NULL - не подошёл:
+    CASE WHEN id IN (...) THEN 0 ... END. Ветвей столько, сколько
+    разных рангов; id - целые из индекса, подставляются литералами,
+    поэтому число совпадений не ограничено числом параметров запроса.
+    """
+    groups = defaultdict(list)
+    for pk, score in scores.items():
+        groups[score].append(int(pk))
+    quote = connection.ops.quote_name
+    column = f'{quote(Recipe._meta.db_table)}.{quote("id")}'
+    branches = ' '.join(
+        f'WHEN {column} IN ({", ".join(map(str, sorted(groups[score])))}) '
+        f'THEN {position}'
+        for position, score in enumerate(sorted(groups, reverse=True)))
+    return RawSQL(f'CASE {branches} END', (), output_field=IntegerField())
@@ -1,12 +1,19 @@
+import json
+
 from rest_framework import serializers
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework.exceptions import ValidationError
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.db import transaction
 
 from recipes.models import (Recipe, Ingredient,
                             Tag, IngredientRecipe,
-                            ShoppingCart, Favorite)
+                            ShoppingCart, ShoppingListItem, Favorite,
+                            search_document, tags_mask)
 from users.serializers import UserSerializer
+from api.catalog import ingredient_catalog
+from api.membership import get_membership
+from api.versions import versions_shared
+from api.fields import RenditionField, StreamingImageField
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
@@ -49,6 +56,14 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'image', 'coocking_time')
 
 
+class RecipeBatchSerializer(serializers.Serializer):
+    """Список id рецептов для пакетных операций с корзиной и избранным."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100)
+
+
 class IngredientSerializer(serializers.ModelSerializer):
     """Сериалайзер модели Ingredient."""
     class Meta:
@@ -96,32 +111,36 @@ class RecipeListSerializer(serializers.ModelSerializer):
         read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_thumb = RenditionField()
+    image_detail = RenditionField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'image_thumb', 'image_detail',
+                  'text', 'cooking_time')
 
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        if not user.is_anonymous:
-            return Favorite.objects.filter(recipe=obj).exists()
-        return False
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        membership = get_membership(self.context.get('request'))
+        return obj.pk in membership.favorites
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        if not user.is_anonymous:
-            return ShoppingCart.objects.filter(recipe=obj).exists()
-        return False
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        membership = get_membership(self.context.get('request'))
+        return obj.pk in membership.shopping_cart
 
 
 class AddIngredientSerializer(serializers.ModelSerializer):
     """
     Serializer для поля ingredient модели Recipe - создание ингредиентов.
+    Существование ингредиентов проверяется по снимку каталога
+    в RecipeWriteSerializer.validate_ingredients.
     """
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
     amount = serializers.IntegerField()
 
     class Meta:
@@ -129,15 +148,59 @@ class AddIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
+def ingredients_in_bulk(ids):
+    """
+    Ингредиенты по id из снимка каталога в памяти, если он не может
+    отстать от БД: версии в общем кеше, удаление ингредиента в другом
+    процессе сразу сбрасывает снимок. Иначе (кеш в памяти процесса,
+    снимок до CATALOG_MAX_AGE секунд) - одним запросом к БД, чтобы
+    удалённый ингредиент не прошёл проверку. Не найденные в снимке
+    тоже проверяются в БД.
+    """
+    if (settings.INGREDIENT_SEARCH_BACKEND != 'memory'
+            or not versions_shared()):
+        return Ingredient.objects.in_bulk(ids)
+    found = ingredient_catalog().in_bulk(ids)
+    missing = ids - found.keys()
+    if missing:
+        found.update(Ingredient.objects.in_bulk(missing))
+    return found
+
+
+def form_to_dict(data, json_fields):
+    """
+    Данные multipart/form-data в виде обычного словаря: поля json_fields
+    передаются JSON-строкой (ingredients=[{"id": 1, "amount": 2}])
+    или повторяющимся ключом (tags=1&tags=2).
+    """
+    plain = data.dict()
+    for name in json_fields:
+        values = data.getlist(name)
+        if len(values) != 1:
+            if values:
+                plain[name] = values
+            continue
+        try:
+            value = json.loads(values[0])
+        except (TypeError, ValueError):
+            raise ValidationError({name: 'Ожидается JSON.'})
+        plain[name] = value if isinstance(value, list) else [value]
+    return plain
+
+
 class RecipeWriteSerializer(serializers.ModelSerializer):
-    """Serializer для модели Recipe - запись / обновление / удаление данных."""
+    """
+    Serializer для модели Recipe - запись / обновление / удаление данных.
+    Принимает JSON с изображением в base64 или multipart/form-data
+    с файлом изображения.
+    """
     ingredients = AddIngredientSerializer(
         many=True,
         write_only=True)
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        many=True)
-    image = Base64ImageField()
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        write_only=True)
+    image = StreamingImageField()
     author = serializers.HiddenField(
         default=serializers.CurrentUserDefault())
 
@@ -146,21 +209,31 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         fields = ('ingredients', 'tags', 'image',
                   'name', 'text', 'cooking_time', 'author')
 
+    def to_internal_value(self, data):
+        if hasattr(data, 'getlist'):
+            data = form_to_dict(data, ('ingredients', 'tags'))
+        return super().to_internal_value(data)
+
     def validate_ingredients(self, value):
         ingredients = value
         if not ingredients:
             raise ValidationError(
                 {'ingredients': 'Нужно выбрать ингредиент!'})
-        ingredients_list = []
-        for item in ingredients:
-            ingredient = get_object_or_404(Ingredient, name=item['id'])
-            if ingredient in ingredients_list:
-                raise ValidationError(
-                    {'ingredients': 'Ингридиенты повторяются!'})
-            if int(item['amount']) <= 0:
-                raise ValidationError(
-                    {'amount': 'Количество должно быть больше 0!'})
-            ingredients_list.append(ingredient)
+        ids = {item['id'] for item in ingredients}
+        if len(ids) != len(ingredients):
+            raise ValidationError(
+                {'ingredients': 'Ингридиенты повторяются!'})
+        if any(item['amount'] <= 0 for item in ingredients):
+            raise ValidationError(
+                {'amount': 'Количество должно быть больше 0!'})
+        found = ingredients_in_bulk(ids)
+        missing = ids - found.keys()
+        if missing:
+            raise ValidationError(
+                {'ingredients': 'Ингредиенты не найдены: '
+                 f'{sorted(missing)}'})
+        self.ingredient_names = [
+            ingredient.name for ingredient in found.values()]
         return value
 
     def validate_tags(self, value):
@@ -168,45 +241,83 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         if not tags:
             raise ValidationError(
                 {'tags': 'Нужно выбрать тег!'})
-        tags_list = []
-        for tag in tags:
-            if tag in tags_list:
-                raise ValidationError(
-                    {'tags': 'Теги повторяются!'})
-            tags_list.append(tag)
+        if len(set(tags)) != len(tags):
+            raise ValidationError(
+                {'tags': 'Теги повторяются!'})
+        missing = set(tags) - Tag.objects.in_bulk(tags).keys()
+        if missing:
+            raise ValidationError(
+                {'tags': f'Теги не найдены: {sorted(missing)}'})
         return value
 
     def to_representation(self, instance):
         ingredients = super().to_representation(instance)
+        ingredients['tags'] = [tag.pk for tag in instance.tags.all()]
         ingredients['ingredients'] = IngredientRecipeSerializer(
-            instance.recipe_ingredients.all(), many=True).data
+            instance.recipe_ingredients.select_related('ingredient'),
+            many=True).data
         return ingredients
 
     def add_tags_ingredients(self, ingredients, tags, model):
-        for ingredient in ingredients:
-            IngredientRecipe.objects.update_or_create(
-                recipe=model,
-                ingredient=ingredient['id'],
-                amount=ingredient['amount'])
+        """
+        Запись состава рецепта: сравнение с текущими строками,
+        вставка, изменение и удаление только отличающихся.
+        Возвращает прежний состав {ingredient_id: amount}.
+        """
+        amounts = {item['id']: item['amount'] for item in ingredients}
+        existing = {
+            row.ingredient_id: row for row in model.recipe_ingredients.all()}
+        old_amounts = {pk: row.amount for pk, row in existing.items()}
+        removed = existing.keys() - amounts.keys()
+        if removed:
+            model.recipe_ingredients.filter(
+                ingredient_id__in=removed).delete()
+        changed = [row for pk, row in existing.items()
+                   if pk in amounts and row.amount != amounts[pk]]
+        for row in changed:
+            row.amount = amounts[row.ingredient_id]
+        IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        IngredientRecipe.objects.bulk_create([
+            IngredientRecipe(recipe=model, ingredient_id=pk, amount=amount)
+            for pk, amount in amounts.items() if pk not in existing])
+        # Маска выставляется до tags.set: обработчик m2m_changed
+        # (recipes.signals) видит её актуальной и не пишет в БД.
+        model.tags_mask = tags_mask(tags)
         model.tags.set(tags)
+        return old_amounts
 
+    def set_search_document(self, validated_data, instance=None):
+        validated_data['search_document'] = search_document(
+            validated_data.get('name', getattr(instance, 'name', '')),
+            validated_data.get('text', getattr(instance, 'text', '')),
+            self.ingredient_names)
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
+        self.set_search_document(validated_data)
+        validated_data['tags_mask'] = tags_mask(tags)
         recipe = super().create(validated_data)
         self.add_tags_ingredients(ingredients, tags, recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        instance.ingredients.clear()
-        self.add_tags_ingredients(ingredients, tags, instance)
+        old_amounts = self.add_tags_ingredients(ingredients, tags, instance)
+        ShoppingListItem.objects.change_recipe(
+            instance, old_amounts,
+            {item['id']: item['amount'] for item in ingredients})
+        self.set_search_document(validated_data, instance)
         return super().update(instance, validated_data)
 
 
 class RecipeMiniSerializer(serializers.ModelSerializer):
     """Сериализатор предназначен для вывода рецептом в FollowSerializer."""
+    image_thumb = RenditionField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'cooking_time', 'image',)
+        fields = ('id', 'name', 'cooking_time', 'image', 'image_thumb')
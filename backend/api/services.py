@@ -1,28 +1,145 @@
-from django.db.models import Sum
+import csv
+import json
+from collections import defaultdict
 from datetime import date
-from django.http import HttpResponse
+from itertools import groupby
+from operator import itemgetter
 
-from recipes.models import IngredientRecipe
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.http import StreamingHttpResponse
 
+from recipes.models import Recipe, ShoppingListItem
 
-def shopping_cart(self, request, author):
-    """Скачивание списка продуктов для выбранных рецептов пользователя."""
-    sum_ingredients_in_recipes = IngredientRecipe.objects.filter(
-        recipe__shopping_cart__author=author
-    ).values(
+EXPORT_CHUNK_SIZE = 500
+EXPORT_FOOTER = 'Foodgram (2022)'
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+# Единицы, которые сводятся к общей: единица -> (базовая, множитель).
+UNIT_CONVERSIONS = {
+    'кг': ('г', 1000),
+    'л': ('мл', 1000),
+    'ст. л.': ('ч. л.', 3),
+}
+
+
+def merge_units(rows):
+    """
+    Слияние строк одного продукта в разных единицах (г и кг, мл и л):
+    количества переводятся в базовую единицу UNIT_CONVERSIONS
+    и суммируются. Строки упорядочены по названию, продукт выдаётся,
+    как только прочитаны его строки - выгрузка по-прежнему идёт
+    потоком. Если продукт записан в одной единице, она и остаётся.
+    """
+    for name, group in groupby(rows, key=itemgetter(0)):
+        totals = {}
+        units = defaultdict(set)
+        for _, unit, amount in group:
+            base, factor = UNIT_CONVERSIONS.get(unit, (unit, 1))
+            totals[base] = totals.get(base, 0) + amount * factor
+            units[base].add(unit)
+        for base, total in totals.items():
+            unit = base
+            if len(units[base]) == 1:
+                unit, = units[base]
+                total //= UNIT_CONVERSIONS.get(unit, (unit, 1))[1]
+            yield name, unit, total
+
+
+def shopping_cart_rows(author):
+    """
+    Суммарное количество ингредиентов в корзине пользователя
+    из сводного списка покупок по алфавиту, одним запросом;
+    строки читаются курсором на стороне сервера, один продукт
+    в разных единицах сводится в одну строку (merge_units).
+    """
+    return merge_units(ShoppingListItem.objects.filter(
+        author=author
+    ).values_list(
+        'ingredient__name', 'ingredient__measurement_unit', 'amount'
+    ).order_by(
         'ingredient__name', 'ingredient__measurement_unit'
-    ).annotate(
-        amounts=Sum('amount', distinct=True)).order_by('amounts')
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE))
+
+
+def export_txt(rows, today):
+    yield f'Список покупок на: {today}\n\n'
+    for name, unit, amount in rows:
+        yield f'{name} - {amount} {unit}\n'
+    yield f'\n\n{EXPORT_FOOTER}'
+
+
+def export_csv(rows, today):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for name, unit, amount in rows:
+        yield writer.writerow((name, amount, unit))
+
+
+def export_json(rows, today):
+    yield '{"date": %s, "ingredients": [' % json.dumps(today)
+    separator = ''
+    for name, unit, amount in rows:
+        yield separator + json.dumps(
+            {'name': name, 'amount': amount, 'measurement_unit': unit},
+            ensure_ascii=False)
+        separator = ', '
+    yield ']}'
+
+
+EXPORTERS = {
+    'txt': (export_txt, 'text/plain; charset=utf-8'),
+    'csv': (export_csv, 'text/csv; charset=utf-8'),
+    'json': (export_json, 'application/json'),
+}
+
+
+def shopping_cart(self, request, author):
+    """
+    Скачивание списка продуктов для выбранных рецептов пользователя.
+    Файл отдаётся потоком, формат выбирается параметром ?format=
+    (txt, csv, json), по умолчанию txt.
+    """
+    export_format = request.accepted_renderer.format
+    if export_format not in EXPORTERS:
+        export_format = 'txt'
+    exporter, content_type = EXPORTERS[export_format]
     today = date.today().strftime("%d-%m-%Y")
-    shopping_list = f'Список покупок на: {today}\n\n'
-    for ingredient in sum_ingredients_in_recipes:
-        shopping_list += (
-            f'{ingredient["ingredient__name"]} - '
-            f'{ingredient["amounts"]} '
-            f'{ingredient["ingredient__measurement_unit"]}\n'
-        )
-    shopping_list += '\n\nFoodgram (2022)'
-    filename = 'shopping_list.txt'
-    response = HttpResponse(shopping_list, content_type='text/plain')
+    response = StreamingHttpResponse(
+        exporter(shopping_cart_rows(author), today),
+        content_type=content_type)
+    filename = f'shopping_list.{export_format}'
     response['Content-Disposition'] = f'attachment; filename={filename}'
     return response
+
+
+def recipes_by_author(author_ids, limit=None):
+    """
+    Последние рецепты авторов, не больше limit на каждого, одним запросом:
+    ROW_NUMBER() OVER (PARTITION BY author_id ORDER BY id DESC).
+    """
+    recipes = Recipe.objects.filter(author_id__in=author_ids)
+    if limit is not None:
+        ranked = recipes.annotate(recipe_rank=Window(
+            RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=F('id').desc(),
+        )).order_by().values(
+            'id', 'author_id', 'name', 'image', 'image_thumb',
+            'cooking_time', 'recipe_rank')
+        sql, params = ranked.query.sql_with_params()
+        recipes = Recipe.objects.raw(
+            f'SELECT * FROM ({sql}) ranked '
+            'WHERE recipe_rank <= %s ORDER BY id DESC',
+            (*params, limit))
+    grouped = defaultdict(list)
+    for recipe in recipes:
+        grouped[recipe.author_id].append(recipe)
+    return grouped
@@ -0,0 +1,88 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from users.models import User
+from api.authentication import invalidate_tokens, invalidate_user_tokens
+from api.search import update_search_index
+from api.versions import bump_version_on_commit, forget_recipe_author
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    bump_version_on_commit('ingredient')
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    bump_version_on_commit('tag')
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    """
+    Версия профиля автора в карточках его рецептов; вход
+    (сохраняется только last_login) профиль не меняет.
+    """
+    if update_fields == frozenset(['last_login']):
+        return
+    bump_version_on_commit(f'user:{instance.pk}')
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    """Смена пароля, активности или профиля - снимок в кеше токенов."""
+    if created or update_fields == frozenset(['last_login']):
+        return
+    transaction.on_commit(partial(invalidate_user_tokens, instance.pk))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Выход (auth/token/logout) удаляет токен."""
+    transaction.on_commit(partial(invalidate_tokens, [instance.key]))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, update_fields=None, **kwargs):
+    bump_version_on_commit(f'recipe:{instance.pk}')
+    if update_fields is None or 'author' in update_fields:
+        forget_recipe_author(instance.pk)
+    if update_fields is None or 'search_document' in update_fields:
+        document = (None if kwargs['signal'] is post_delete
+                    else instance.search_document)
+        transaction.on_commit(
+            partial(update_search_index, instance.pk, document))
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_renamed(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    if Recipe.objects.filter(ingredients=instance).refresh_search_documents():
+        bump_version_on_commit('recipe_search')
+
+
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    bump_version_on_commit(f'recipe:{instance.recipe_id}')
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, Recipe):
+        bump_version_on_commit(f'recipe:{instance.pk}')
+    else:
+        for pk in pk_set or ():
+            bump_version_on_commit(f'recipe:{pk}')
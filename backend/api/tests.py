@@ -0,0 +1,715 @@
+import shutil
+import tempfile
+from base64 import b64encode
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import Cursor
+from rest_framework.test import APIClient, APITestCase
+
+from recipes.models import (Favorite, FeedItem, Follow, Ingredient,
+                            IngredientRecipe, Recipe, ShoppingCart,
+                            ShoppingListItem, Tag, refresh_counters,
+                            search_document)
+from recipes.toggles import (ADDED, EXISTS, NOT_FOUND, REMOVED,
+                             SHOPPING_CART)
+from users.models import User
+from api import async_views
+from api.authentication import invalidate_user_tokens
+from api.bench.runner import recipe_body
+from api.catalog import IngredientCatalog
+from api.fields import CHUNK_CHARS, StreamingImageField
+from api.metrics import QueryBudgetExceeded
+from api.paginations import ApiCursorPagination
+from api.search import recipe_search_index
+from api.versions import bump_version, get_versions
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+class MediaRootMixin:
+    """Файлы тестов - во временном MEDIA_ROOT, не в каталоге проекта."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+
+class CatalogDataMixin(MediaRootMixin):
+    """Пользователи, рецепты, подписки, избранное и корзина."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Tag.objects.bulk_create([
+            Tag(name=f'Тег {i}', color=f'00000{i}', slug=f'tag{i}')
+            for i in range(3)])
+        Ingredient.objects.bulk_create([
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(20)])
+        User.objects.bulk_create([
+            User(username=f'user{i}', email=f'user{i}@example.com',
+                 first_name='Имя', last_name='Фамилия')
+            for i in range(4)])
+        # SQLite не возвращает id из bulk_create - строки перечитываются.
+        tags = list(Tag.objects.order_by('id'))
+        ingredients = list(Ingredient.objects.order_by('id'))
+        cls.users = list(User.objects.order_by('id'))
+        cls.user = cls.users[0]
+        Recipe.objects.bulk_create([
+            Recipe(author=cls.users[i % 4], name=f'Рецепт {i}',
+                   text='Описание', cooking_time=10, image='recipes/a.png')
+            for i in range(20)])
+        recipes = list(Recipe.objects.order_by('id'))
+        IngredientRecipe.objects.bulk_create([
+            IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                             amount=10 + i)
+            for i, recipe in enumerate(recipes)
+            for ingredient in ingredients[i % 10:i % 10 + 5]])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag.pk)
+            for i, recipe in enumerate(recipes)
+            for tag in tags[:i % 3 + 1]])
+        Recipe.objects.all().refresh_tags_masks()
+        Recipe.objects.all().refresh_search_documents()
+        Follow.objects.bulk_create([
+            Follow(user=cls.user, author=author)
+            for author in cls.users[1:]])
+        Favorite.objects.bulk_create([
+            Favorite(author=cls.user, recipe=recipe)
+            for recipe in recipes[::2]])
+        ShoppingCart.objects.bulk_create([
+            ShoppingCart(author=cls.user, recipe=recipe)
+            for recipe in recipes[:8]])
+        ShoppingListItem.objects.rebuild()
+        refresh_counters()
+        cls.recipe = recipes[-1]
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class QueryCountTests(CatalogDataMixin, APITestCase):
+    """
+    Число SQL-запросов основных эндпоинтов не зависит от размера
+    страницы и объёма данных и укладывается в QUERY_BUDGETS.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_constant(self, queries, urls):
+        for url in urls:
+            with self.subTest(url=url), self.assertNumQueries(queries):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+
+    def test_recipe_list(self):
+        self.assert_constant(5, [
+            '/api/recipes/?limit=3',
+            '/api/recipes/?limit=12',
+        ])
+
+    def test_recipe_list_filtered(self):
+        # Фильтр - соединение в том же запросе, без списка id.
+        self.assert_constant(5, [
+            '/api/recipes/?limit=3&is_favorited=1',
+            '/api/recipes/?limit=12&is_favorited=1',
+            '/api/recipes/?limit=12&is_in_shopping_cart=1',
+        ])
+
+    def test_recipe_list_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assert_constant(5, [
+            '/api/recipes/?limit=3',
+            '/api/recipes/?limit=12',
+        ])
+
+    def test_recipe_detail(self):
+        # Плюс один запрос при холодном кеше: автор для версии user:<id>.
+        self.assert_constant(5, [f'/api/recipes/{self.recipe.pk}/'])
+        self.assert_constant(0, [f'/api/recipes/{self.recipe.pk}/'])
+
+    def test_subscriptions(self):
+        self.assert_constant(3, [
+            '/api/users/subscriptions/?recipes_limit=1',
+            '/api/users/subscriptions/?recipes_limit=5&limit=10',
+        ])
+
+    def test_download_shopping_cart(self):
+        self.assert_constant(2, [
+            '/api/recipes/download_shopping_cart/',
+            '/api/recipes/download_shopping_cart/?format=csv',
+        ])
+
+
+class RecipeVersionTests(CatalogDataMixin, APITestCase):
+    """ETag карточки рецепта меняется только с профилем его автора."""
+
+    def setUp(self):
+        cache.clear()
+        self.url = f'/api/recipes/{self.recipe.pk}/'
+
+    def etag(self):
+        return self.client.get(self.url)['ETag']
+
+    def save(self, user, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save(**kwargs)
+
+    def test_author_profile(self):
+        etag = self.etag()
+        author = self.recipe.author
+        author.first_name = 'Новое'
+        self.save(author)
+        self.assertNotEqual(self.etag(), etag)
+
+    def test_login_and_other_users(self):
+        etag = self.etag()
+        self.save(self.recipe.author, update_fields=['last_login'])
+        other = User.objects.exclude(pk=self.recipe.author_id).first()
+        self.save(other)
+        self.assertEqual(self.etag(), etag)
+
+
+class RecipeFilterTests(CatalogDataMixin, APITestCase):
+    """Фильтры избранного и корзины и флаги в выдаче."""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def test_flag_filters(self):
+        for flag, links in (('is_favorited', Favorite.objects),
+                            ('is_in_shopping_cart', ShoppingCart.objects)):
+            with self.subTest(flag=flag):
+                results = self.client.get(
+                    f'/api/recipes/?{flag}=1&limit=50').data['results']
+                self.assertEqual(
+                    {item['id'] for item in results},
+                    set(links.filter(author=self.user).values_list(
+                        'recipe_id', flat=True)))
+                self.assertTrue(all(item[flag] for item in results))
+
+    def test_flag_filters_anonymous(self):
+        self.client.force_authenticate(None)
+        response = self.client.get('/api/recipes/?is_favorited=1&limit=50')
+        self.assertEqual(response.data['count'], Recipe.objects.count())
+
+
+class MetricsTests(CatalogDataMixin, APITestCase):
+    """Бюджеты SQL-запросов и заголовок Server-Timing."""
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(QUERY_BUDGET_STRICT=True,
+                       QUERY_BUDGETS={'RecipeViewSet.list': 2})
+    def test_budget_exceeded_strict(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get('/api/recipes/')
+
+    @override_settings(QUERY_BUDGETS={'RecipeViewSet.list': 2})
+    def test_budget_exceeded_logged(self):
+        with self.assertLogs('api.metrics', 'WARNING'):
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_server_timing_hidden(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/recipes/'))
+        self.client.force_authenticate(self.user)
+        self.assertNotIn('Server-Timing', self.client.get('/api/recipes/'))
+
+    def test_server_timing_staff(self):
+        self.client.force_authenticate(
+            User(pk=self.user.pk, username='staff', is_staff=True))
+        response = self.client.get('/api/recipes/')
+        self.assertIn('queries', response['Server-Timing'])
+
+    @override_settings(DEBUG=True)
+    def test_server_timing_debug(self):
+        self.assertIn('Server-Timing', self.client.get('/api/recipes/'))
+
+
+@override_settings(TOKEN_CACHE_TIMEOUT=300)
+class TokenCacheTests(APITestCase):
+    """Снимок пользователя по токену и его сброс."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            username='token', email='token@example.com')
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def status(self):
+        return self.client.get('/api/users/me/').status_code
+
+    def test_save_invalidates(self):
+        self.assertEqual(self.status(), 200)
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.status(), 401)
+
+    def test_update_bypasses_invalidation(self):
+        self.assertEqual(self.status(), 200)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.status(), 200)
+        invalidate_user_tokens(self.user.pk)
+        self.assertEqual(self.status(), 401)
+
+
+class PaginationTests(CatalogDataMixin, APITestCase):
+    """Вывод по ключу (?cursor=) сохраняет порядок запроса."""
+
+    def setUp(self):
+        cache.clear()
+
+    def ids(self, url):
+        return [item['id'] for item in self.client.get(url).data['results']]
+
+    def cursor_ids(self, url):
+        ids = []
+        url += '&cursor=&limit=3'
+        while url:
+            data = self.client.get(url).data
+            ids.extend(item['id'] for item in data['results'])
+            url = data['next']
+        return ids
+
+    def test_cursor_popular(self):
+        url = '/api/recipes/?ordering=popular'
+        self.assertEqual(self.cursor_ids(url), self.ids(url + '&limit=50'))
+
+    def test_cursor_popular_ties(self):
+        # Повторов favorites_count больше offset_cutoff курсора DRF.
+        cutoff = ApiCursorPagination.offset_cutoff
+        Recipe.objects.bulk_create([
+            Recipe(author=self.user, name=f'Без избранного {i}',
+                   text='Описание', cooking_time=10, image='recipes/a.png')
+            for i in range(cutoff + 10)])
+        expected = list(Recipe.objects.order_by(
+            '-favorites_count', '-id').values_list('id', flat=True))
+        url = '/api/recipes/?ordering=popular&cursor=&limit=100'
+        ids = []
+        while url:
+            data = self.client.get(url).data
+            ids.extend(item['id'] for item in data['results'])
+            url = data['next']
+        self.assertEqual(ids, expected)
+
+    def test_cursor_previous(self):
+        url = '/api/recipes/?ordering=popular&cursor=&limit=3'
+        first = self.client.get(url).data
+        second = self.client.get(first['next']).data
+        self.assertIsNone(first['previous'])
+        previous = self.client.get(second['previous']).data
+        self.assertEqual(previous['results'], first['results'])
+        self.assertEqual(
+            self.client.get(previous['next']).data['results'],
+            second['results'])
+
+    def test_cursor_invalid(self):
+        cursor = ApiCursorPagination()
+        cursor.base_url = 'http://testserver/api/recipes/'
+        url = cursor.encode_cursor(Cursor(0, False, '[1'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_cursor_search(self):
+        url = '/api/recipes/?search=1'
+        ranked = self.ids(url + '&limit=50')
+        self.assertNotEqual(ranked, sorted(ranked, reverse=True))
+        self.assertEqual(self.cursor_ids(url), ranked)
+
+
+class RecipeSearchTests(CatalogDataMixin, APITestCase):
+    """Поиск по индексу в памяти: все совпадения и правка на месте."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_count_beyond_former_limit(self):
+        Recipe.objects.bulk_create([
+            Recipe(author=self.user, name=f'Рецепт пакета {i}',
+                   text='Описание', cooking_time=10, image='recipes/a.png')
+            for i in range(1010)])
+        Recipe.objects.all().refresh_search_documents()
+        bump_version('recipe_search')
+        data = self.client.get('/api/recipes/?search=рецепт&limit=100').data
+        self.assertEqual(data['count'], Recipe.objects.count())
+        last = self.client.get(
+            '/api/recipes/?search=рецепт&limit=100&page=11').data
+        self.assertEqual(len(last['results']), data['count'] - 1000)
+
+    def test_pages_follow_rank(self):
+        url = '/api/recipes/?search=рецепт 1'
+        ranked = [item['id'] for item in
+                  self.client.get(url + '&limit=50').data['results']]
+        paged = []
+        for page in range(1, 4):
+            paged.extend(item['id'] for item in self.client.get(
+                f'{url}&limit=3&page={page}').data['results'])
+        self.assertEqual(paged, ranked[:len(paged)])
+
+    @mock.patch('recipes.signals.schedule')
+    def test_update_in_place(self, schedule):
+        index = recipe_search_index()
+        self.recipe.name = 'Уникальный пирог'
+        self.recipe.search_document = search_document(
+            self.recipe.name, self.recipe.text, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.save()
+        self.assertIs(recipe_search_index(), index)
+        self.assertEqual(list(index.scores('уникальн')), [self.recipe.pk])
+        self.assertNotIn(self.recipe.pk, index.scores('ингредиент'))
+        pk = self.recipe.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.delete()
+        self.assertIs(recipe_search_index(), index)
+        self.assertEqual(index.scores('уникальн'), {})
+        self.assertEqual(self.client.get(
+            '/api/recipes/?search=уникальн').data['count'], 0)
+        self.assertFalse(Recipe.objects.filter(pk=pk).exists())
+
+
+class TrackedFile(tempfile.SpooledTemporaryFile):
+    opened = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.opened.append(self)
+
+
+class StreamingImageFieldTests(SimpleTestCase):
+    """Временный файл base64 закрывается при любой ошибке."""
+
+    def setUp(self):
+        TrackedFile.opened = []
+        patcher = mock.patch('api.fields.SpooledTemporaryFile', TrackedFile)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assert_fails(self, raw, code, tail=''):
+        data = 'data:image/png;base64,' + b64encode(raw).decode() + tail
+        with self.assertRaises(ValidationError) as error:
+            StreamingImageField().to_internal_value(data)
+        self.assertEqual(error.exception.detail[0].code, code)
+        self.assertTrue(TrackedFile.opened)
+        self.assertTrue(all(file.closed for file in TrackedFile.opened))
+
+    def test_not_image(self):
+        self.assert_fails(b'not an image' * 10, 'not_image')
+
+    def test_invalid_base64_later_chunk(self):
+        raw = PNG_SIGNATURE + bytes(CHUNK_CHARS * 3 // 4 - len(PNG_SIGNATURE))
+        self.assert_fails(raw, 'invalid_base64', tail='!!!!')
+
+    def test_invalid_image(self):
+        self.assert_fails(PNG_SIGNATURE + bytes(100), 'invalid_image')
+
+
+class IngredientCatalogTests(CatalogDataMixin, APITestCase):
+    """Каталог ингредиентов из снимка в памяти."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_conditional_get(self):
+        pk = Ingredient.objects.values_list('pk', flat=True).first()
+        for url in ('/api/ingredients/', '/api/ingredients/?name=ингр',
+                    f'/api/ingredients/{pk}/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('Last-Modified', response)
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_detail_not_found(self):
+        self.assertEqual(
+            self.client.get('/api/ingredients/0/').status_code, 404)
+
+    def test_write_ignores_stale_snapshot(self):
+        # Снимок другого процесса: ингредиента уже нет в БД.
+        stale = IngredientCatalog([(10 ** 6, 'удалённый', 'г')])
+        self.client.force_authenticate(self.user)
+        tag = Tag.objects.values_list('pk', flat=True).first()
+        with mock.patch('api.serializers.ingredient_catalog',
+                        return_value=stale):
+            response = self.client.post(
+                '/api/recipes/',
+                recipe_body('Новый', [tag], [10 ** 6]), format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ToggleTests(CatalogDataMixin, APITestCase):
+    """Избранное, корзина и подписки: исход INSERT / DELETE и счётчики."""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def assert_toggle(self, url, counter):
+        """201 / 400 на добавление, 204 / 404 на удаление."""
+        before = counter()
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(counter(), before + 1)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(counter(), before + 1)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(counter(), before)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertEqual(counter(), before)
+
+    def recipe_counter(self, recipe, field):
+        return lambda: getattr(Recipe.objects.get(pk=recipe.pk), field)
+
+    def test_favorite(self):
+        recipe = Recipe.objects.exclude(favorite__author=self.user).first()
+        self.assert_toggle(f'/api/recipes/{recipe.pk}/favorite/',
+                           self.recipe_counter(recipe, 'favorites_count'))
+        self.assertFalse(
+            Favorite.objects.filter(author=self.user, recipe=recipe).exists())
+
+    def test_shopping_cart(self):
+        recipe = Recipe.objects.exclude(
+            shopping_cart__author=self.user).first()
+        url = f'/api/recipes/{recipe.pk}/shopping_cart/'
+        items = ShoppingListItem.objects.filter(author=self.user)
+        before = dict(items.values_list('ingredient_id', 'amount'))
+        self.assertEqual(self.client.post(url).status_code, 201)
+        added = dict(items.values_list('ingredient_id', 'amount'))
+        for row in recipe.recipe_ingredients.values(
+                'ingredient_id', 'amount'):
+            self.assertEqual(
+                added[row['ingredient_id']],
+                before.get(row['ingredient_id'], 0) + row['amount'])
+        self.client.delete(url)
+        self.assertEqual(
+            dict(items.values_list('ingredient_id', 'amount')), before)
+        self.assert_toggle(url, self.recipe_counter(recipe, 'cart_count'))
+
+    def test_recipe_not_found(self):
+        for action in ('favorite', 'shopping_cart'):
+            url = f'/api/recipes/{10 ** 6}/{action}/'
+            with self.subTest(action=action):
+                self.assertEqual(self.client.post(url).status_code, 404)
+                self.assertEqual(self.client.delete(url).status_code, 404)
+
+    def test_subscribe(self):
+        follower, author = self.users[1], self.users[2]
+        self.client.force_authenticate(follower)
+        feed = FeedItem.objects.filter(user=follower)
+        self.assert_toggle(
+            f'/api/users/{author.pk}/subscribe/',
+            lambda: User.objects.get(pk=author.pk).followers_count)
+        self.assertFalse(feed.exists())
+        self.client.post(f'/api/users/{author.pk}/subscribe/')
+        self.assertEqual(
+            set(feed.values_list('recipe_id', flat=True)),
+            set(author.recipe.values_list('id', flat=True)))
+
+    def test_subscribe_self(self):
+        response = self.client.post(f'/api/users/{self.user.pk}/subscribe/')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Follow.objects.filter(
+            user=self.user, author=self.user).exists())
+
+    def test_subscribe_not_found(self):
+        url = f'/api/users/{10 ** 6}/subscribe/'
+        self.assertEqual(self.client.post(url).status_code, 404)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+
+
+class BatchTests(CatalogDataMixin, APITestCase):
+    """
+    Пакетные add_many / remove_many: итог по каждому id.
+    Вставка одним INSERT ... RETURNING (SQLite 3.35+, PostgreSQL).
+    """
+    returning = True
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('recipes.toggles.returning_supported',
+                             return_value=self.returning)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_authenticate(self.user)
+        favorites = Recipe.objects.filter(favorite__author=self.user)
+        self.favorite = favorites.first()
+        self.other = Recipe.objects.exclude(
+            pk__in=favorites.values('pk')).first()
+
+    def batch(self, method, url, ids):
+        response = getattr(self.client, method)(
+            url, {'recipes': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return [(item['id'], item['status'])
+                for item in response.data['results']]
+
+    def count(self, recipe, field='favorites_count'):
+        return getattr(Recipe.objects.get(pk=recipe.pk), field)
+
+    def test_add_mixed(self):
+        before = self.count(self.favorite), self.count(self.other)
+        missing = 10 ** 6
+        results = self.batch(
+            'post', '/api/recipes/favorite/batch/',
+            [self.other.pk, self.favorite.pk, missing, self.other.pk])
+        self.assertEqual(results, [(self.other.pk, ADDED),
+                                   (self.favorite.pk, EXISTS),
+                                   (missing, NOT_FOUND)])
+        self.assertEqual((self.count(self.favorite), self.count(self.other)),
+                         (before[0], before[1] + 1))
+
+    def test_remove_mixed(self):
+        before = self.count(self.favorite), self.count(self.other)
+        results = self.batch(
+            'delete', '/api/recipes/favorite/batch/',
+            [self.favorite.pk, self.other.pk, 10 ** 6])
+        self.assertEqual(results, [(self.favorite.pk, REMOVED),
+                                   (self.other.pk, NOT_FOUND),
+                                   (10 ** 6, NOT_FOUND)])
+        self.assertEqual((self.count(self.favorite), self.count(self.other)),
+                         (before[0] - 1, before[1]))
+
+    def test_add_concurrent(self):
+        # Тот же рецепт добавлен параллельно между проверкой и INSERT:
+        # побочные эффекты применяет только тот, кто вставил строку.
+        recipe = Recipe.objects.exclude(
+            shopping_cart__author=self.user).first()
+        before = self.count(recipe, 'cart_count')
+        insert_many = SHOPPING_CART.insert_many
+
+        def concurrent(owner_id, target_ids):
+            ShoppingCart.objects.create(author_id=owner_id, recipe=recipe)
+            return insert_many(owner_id, target_ids)
+
+        with mock.patch.object(SHOPPING_CART, 'insert_many', concurrent):
+            results = self.batch('post', '/api/recipes/shopping_cart/batch/',
+                                 [recipe.pk])
+        self.assertEqual(results, [(recipe.pk, EXISTS)])
+        self.assertEqual(self.count(recipe, 'cart_count'), before + 1)
+
+    def test_max_length(self):
+        url = '/api/recipes/favorite/batch/'
+        ids = list(range(1, 102))
+        response = self.client.post(url, {'recipes': ids}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(self.batch('post', url, ids[:100])), 100)
+
+    def test_clear(self):
+        cart = ShoppingCart.objects.filter(author=self.user)
+        ids = set(cart.values_list('recipe_id', flat=True))
+        response = self.client.post('/api/recipes/shopping_cart/clear/')
+        self.assertEqual(
+            {item['id'] for item in response.data['results']}, ids)
+        self.assertFalse(cart.exists())
+        self.assertFalse(
+            ShoppingListItem.objects.filter(author=self.user).exists())
+        response = self.client.post('/api/recipes/shopping_cart/clear/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+
+class BatchFallbackTests(BatchTests):
+    """То же без INSERT ... RETURNING: вставка по строке."""
+    returning = False
+
+
+class ShoppingListTests(CatalogDataMixin, APITestCase):
+    """Сводный список покупок совпадает с агрегацией по корзинам."""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+        self.cart = Recipe.objects.filter(
+            shopping_cart__author=self.user).exclude(
+                author=self.user).order_by('id').first()
+        # Рецепт ещё в одной корзине: изменения касаются обеих.
+        ShoppingCart.objects.create(author=self.users[2], recipe=self.cart)
+
+    def assert_consistent(self):
+        expected = {(author_id, pk): total for author_id, pk, total
+                    in ShoppingListItem.objects.live_totals()}
+        stored = {(author_id, pk): amount for author_id, pk, amount
+                  in ShoppingListItem.objects.values_list(
+                      'author_id', 'ingredient_id', 'amount')}
+        self.assertEqual(stored, expected)
+        call_command('rebuild_shopping_lists', verify=True, stdout=StringIO())
+
+    def test_cart_add_remove(self):
+        recipe = Recipe.objects.exclude(
+            shopping_cart__author=self.user).first()
+        url = f'/api/recipes/{recipe.pk}/shopping_cart/'
+        self.client.post(url)
+        self.assert_consistent()
+        self.client.delete(url)
+        self.assert_consistent()
+
+    def test_recipe_edit(self):
+        old = list(self.cart.recipe_ingredients.order_by(
+            'ingredient_id').values_list('ingredient_id', flat=True))
+        added = Ingredient.objects.exclude(pk__in=old).first().pk
+        # Количество первых трёх меняется, два удаляются, один новый.
+        body = recipe_body('Изменённый', [Tag.objects.first().pk],
+                           old[:3] + [added], shift=7)
+        self.client.force_authenticate(self.cart.author)
+        response = self.client.patch(
+            f'/api/recipes/{self.cart.pk}/', body, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(self.cart.recipe_ingredients.values_list(
+                'ingredient_id', flat=True)), set(old[:3] + [added]))
+        self.assert_consistent()
+
+    def test_recipe_delete(self):
+        self.client.force_authenticate(self.cart.author)
+        response = self.client.delete(f'/api/recipes/{self.cart.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_consistent()
+
+
+class AsyncConditionalTests(CatalogDataMixin, APITestCase):
+    """Версии для ETag асинхронных представлений."""
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, **headers):
+        request = RequestFactory().get('/api/tags/', **headers)
+        return async_to_sync(async_views.tag_list)(request)
+
+    def test_local_cache_read_inline(self):
+        etag = self.get()['ETag']
+        with mock.patch('api.async_views.sync_to_async') as wrapped:
+            response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        wrapped.assert_not_called()
+
+    def test_shared_cache_read_in_thread(self):
+        shared = mock.patch('api.async_views.versions_shared',
+                            return_value=True)
+        thread = mock.patch('api.async_views.sync_to_async',
+                            wraps=sync_to_async)
+        with shared, thread as wrapped:
+            self.assertEqual(self.get().status_code, 200)
+        wrapped.assert_called_once_with(get_versions)
@@ -1,6 +1,7 @@
 from django.urls import include, path, re_path
 from rest_framework.routers import DefaultRouter
-from .views import RecipeViewSet, TagViewSet, IngredientViewSet
+from .views import (RecipeViewSet, TagViewSet, IngredientViewSet,
+                    MetricsView)
 from users.views import UserViewSet
 
 
@@ -11,6 +12,7 @@ router.register('tags', TagViewSet)
 router.register('ingredients', IngredientViewSet)
 
 urlpatterns = [
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('', include(router.urls)),
     re_path(r'auth/', include('djoser.urls.authtoken')),
 ]
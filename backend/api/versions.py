@@ -0,0 +1,76 @@
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes.models import Recipe
+
+VERSION_KEY = 'version:{}'
+AUTHOR_KEY = 'recipe_author:{}'
+# Бэкенды кеша в памяти процесса: версии не видны другим процессам.
+LOCAL_BACKENDS = ('LocMemCache', 'DummyCache')
+
+
+def _now():
+    return int(time.time() * 1000)
+
+
+def get_version(name):
+    """
+    Текущая версия именованного набора данных.
+    Версия - время последнего изменения в миллисекундах, поэтому
+    после сброса кеша она не совпадёт ни с одной выданной ранее
+    и годится для заголовка Last-Modified.
+    """
+    return cache.get_or_set(VERSION_KEY.format(name), _now, None)
+
+
+def get_versions(names):
+    """Версии нескольких наборов данных одним обращением к кешу."""
+    keys = [VERSION_KEY.format(name) for name in names]
+    stored = cache.get_many(keys)
+    return [stored.get(key) or get_version(name)
+            for name, key in zip(names, keys)]
+
+
+def bump_version(name):
+    """Отметить набор данных изменённым."""
+    key = VERSION_KEY.format(name)
+    version = max(_now(), (cache.get(key) or 0) + 1)
+    cache.set(key, version, None)
+    return version
+
+
+def bump_version_on_commit(name):
+    """
+    Сменить версию после фиксации транзакции, чтобы параллельный
+    запрос не закешировал старые данные под новой версией.
+    """
+    transaction.on_commit(partial(bump_version, name))
+
+
+def recipe_author_id(pk):
+    """
+    id автора рецепта - для версии user:<id> в ETag карточки.
+    Хранится в кеше без срока, сбрасывается при сохранении
+    и удалении рецепта (api.signals); None - рецепта нет.
+    """
+    key = AUTHOR_KEY.format(pk)
+    author_id = cache.get(key)
+    if author_id is None:
+        author_id = Recipe.objects.filter(pk=pk).values_list(
+            'author_id', flat=True).first()
+        if author_id is not None:
+            cache.set(key, author_id, None)
+    return author_id
+
+
+def forget_recipe_author(pk):
+    transaction.on_commit(partial(cache.delete, AUTHOR_KEY.format(pk)))
+
+
+def versions_shared():
+    """Смена версии сразу видна всем процессам (общий бэкенд кеша)."""
+    return not settings.CACHES['default']['BACKEND'].endswith(LOCAL_BACKENDS)
@@ -1,34 +1,54 @@
+from functools import partial
+
 from rest_framework import viewsets
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import mixins
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.views import APIView
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
 from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.http import HttpResponse
 
-from recipes.models import (Recipe, Tag, Ingredient,
-                            Favorite, ShoppingCart, User)
+from recipes.models import Recipe, Tag, Ingredient, FeedItem
+from recipes.toggles import FAVORITE, SHOPPING_CART, ADDED, REMOVED
 from api.serializers import (RecipeListSerializer, TagSerializer,
                              IngredientSerializer, FavoriteSerializer,
-                             ShoppingCartSerializer, RecipeWriteSerializer)
+                             ShoppingCartSerializer, RecipeWriteSerializer,
+                             RecipeBatchSerializer)
 from api.services import shopping_cart
+from api.membership import invalidate_membership
+from api.versions import recipe_author_id
+from api.catalog import ingredient_catalog
+from api.fields import check_upload_size
+from api.mixins import ConditionalCacheMixin, MetricsMixin
+from api.metrics import registry
 from api.permissions import IsOwnerOrAdminOrReadOnly
 from api.filters import IngredientSearchFilter, RecipeFilter
-from api.paginations import ApiPagination
+from api.paginations import ApiPagination, FeedPagination
+from api.renderers import CSVRenderer, PlainTextRenderer
 
 
-class TagViewSet(mixins.ListModelMixin,
+class TagViewSet(MetricsMixin,
+                 ConditionalCacheMixin,
+                 mixins.ListModelMixin,
                  mixins.RetrieveModelMixin,
                  viewsets.GenericViewSet):
     """Функция для модели тегов."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny, )
+    cache_versions = ('tag', )
 
 
-class IngredientViewSet(mixins.ListModelMixin,
+class IngredientViewSet(MetricsMixin,
+                        ConditionalCacheMixin,
+                        mixins.ListModelMixin,
                         mixins.RetrieveModelMixin,
                         viewsets.GenericViewSet):
     """Функция для модели ингредиентов."""
@@ -36,22 +56,106 @@ class IngredientViewSet(mixins.ListModelMixin,
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny, )
     filter_backends = (IngredientSearchFilter, )
-    search_fields = ('^name',)
+    cache_versions = ('ingredient', )
+
+    def use_memory(self):
+        return settings.INGREDIENT_SEARCH_BACKEND == 'memory'
+
+    def use_response_cache(self):
+        """Снимок и так в памяти, кешировать ответы из него незачем."""
+        return not self.use_memory()
+
+    def list(self, request, *args, **kwargs):
+        """
+        Каталог и автодополнение по ?name= отдаются из снимка
+        в памяти, если INGREDIENT_SEARCH_BACKEND = 'memory';
+        ETag / Last-Modified - по версии каталога, как и из БД.
+        """
+        if not self.use_memory():
+            return super().list(request, *args, **kwargs)
+        return self.get_cached_response(
+            self.list_snapshot, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.use_memory():
+            return super().retrieve(request, *args, **kwargs)
+        return self.get_cached_response(
+            self.retrieve_snapshot, request, *args, **kwargs)
 
+    def list_snapshot(self, request, *args, **kwargs):
+        catalog = ingredient_catalog()
+        name = request.query_params.get(IngredientSearchFilter.search_param)
+        return Response(catalog.search(name) if name else catalog.catalog)
 
-class RecipeViewSet(viewsets.ModelViewSet):
+    def retrieve_snapshot(self, request, *args, **kwargs):
+        pk = self.kwargs[self.lookup_field]
+        item = ingredient_catalog().get(int(pk)) if pk.isdigit() else None
+        if item is None:
+            raise NotFound
+        return Response(item.as_dict())
+
+
+class RecipeViewSet(MetricsMixin,
+                    ConditionalCacheMixin,
+                    viewsets.ModelViewSet):
     """Вьюсет модели Recipe: [GET, POST, DELETE, PATCH]."""
     queryset = Recipe.objects.all()
     permission_classes = (IsOwnerOrAdminOrReadOnly, )
     filter_backends = (DjangoFilterBackend, )
     pagination_class = ApiPagination
     filterset_class = RecipeFilter
+    cache_actions = ('retrieve', )
+    cache_per_user = True
+
+    def get_cache_versions(self):
+        pk = self.kwargs[self.lookup_field]
+        pk = int(pk) if pk.isdigit() else pk
+        author_id = recipe_author_id(pk) if isinstance(pk, int) else None
+        versions = ['tag', 'ingredient', f'recipe:{pk}', f'user:{author_id}']
+        if self.request.user.is_authenticated:
+            versions.append(f'membership:{self.request.user.pk}')
+        return versions
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.action in ('create', 'update', 'partial_update'):
+            check_upload_size(request)
+
+    def get_queryset(self):
+        if self.request.method in SAFE_METHODS:
+            user = self.request.user
+            return Recipe.objects.with_related(user).with_user_flags(user)
+        return super().get_queryset()
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeListSerializer
         return RecipeWriteSerializer
 
+    def toggle(self, request, toggle, serializer_class, removed):
+        """
+        Добавить (POST) / удалить (DELETE) рецепт у текущего
+        пользователя: исход решает один INSERT или DELETE.
+        """
+        user = request.user
+        if request.method == 'POST':
+            recipe = get_object_or_404(
+                Recipe.objects.only('id', 'name', 'image', 'cooking_time'),
+                pk=self.kwargs['pk'])
+            if not toggle.add(user.pk, recipe.pk):
+                return Response({'errors': 'Рецепт уже добавлен!'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            invalidate_membership(request)
+            serializer = serializer_class(
+                serializer_class.Meta.model(author=user, recipe=recipe))
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        pk = self.kwargs['pk']
+        if not pk.isdigit() or not toggle.remove(user.pk, int(pk)):
+            return Response({'errors': 'Объект не найден'},
+                            status=status.HTTP_404_NOT_FOUND)
+        invalidate_membership(request)
+        return Response(removed, status=status.HTTP_204_NO_CONTENT)
+
     @action(detail=True,
             methods=['post', 'delete'],
             permission_classes=[IsAuthenticated])
@@ -60,27 +164,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
         Получить / Добавить / Удалить  рецепт
         из избранного у текущего пользоватля.
         """
-        recipe = get_object_or_404(Recipe, id=self.kwargs.get('pk'))
-        user = self.request.user
-        if request.method == 'POST':
-            if Favorite.objects.filter(author=user,
-                                       recipe=recipe).exists():
-                return Response({'errors': 'Рецепт уже добавлен!'},
-                                status=status.HTTP_400_BAD_REQUEST)
-            serializer = FavoriteSerializer(data=request.data)
-            if serializer.is_valid(raise_exception=True):
-                serializer.save(author=user, recipe=recipe)
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-            return Response(serializer.errors,
-                            status=status.HTTP_400_BAD_REQUEST)
-        if not Favorite.objects.filter(author=user,
-                                       recipe=recipe).exists():
-            return Response({'errors': 'Объект не найден'},
-                            status=status.HTTP_404_NOT_FOUND)
-        Favorite.objects.get(recipe=recipe).delete()
-        return Response('Рецепт успешно удалён из избранного.',
-                        status=status.HTTP_204_NO_CONTENT)
+        return self.toggle(request, FAVORITE, FavoriteSerializer,
+                           'Рецепт успешно удалён из избранного.')
 
     @action(detail=True,
             methods=['post', 'delete'],
@@ -90,38 +175,90 @@ class RecipeViewSet(viewsets.ModelViewSet):
         Получить / Добавить / Удалить  рецепт
         из списка покупок у текущего пользоватля.
         """
-        recipe = get_object_or_404(Recipe, id=self.kwargs.get('pk'))
-        user = self.request.user
+        return self.toggle(request, SHOPPING_CART, ShoppingCartSerializer,
+                           'Рецепт успешно удалён из списка покупок.')
+
+    def toggle_batch(self, request, toggle):
+        """
+        Пакет: POST добавляет, DELETE удаляет рецепты {"recipes": [id]}
+        одним запросом на запись; итог по каждому id.
+        """
+        serializer = RecipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['recipes']
         if request.method == 'POST':
-            if ShoppingCart.objects.filter(author=user,
-                                           recipe=recipe).exists():
-                return Response({'errors': 'Рецепт уже добавлен!'},
-                                status=status.HTTP_400_BAD_REQUEST)
-            serializer = ShoppingCartSerializer(data=request.data)
-            if serializer.is_valid(raise_exception=True):
-                serializer.save(author=user, recipe=recipe)
-                return Response(serializer.data,
-                                status=status.HTTP_201_CREATED)
-            return Response(serializer.errors,
-                            status=status.HTTP_400_BAD_REQUEST)
-        if not ShoppingCart.objects.filter(author=user,
-                                           recipe=recipe).exists():
-            return Response({'errors': 'Объект не найден'},
-                            status=status.HTTP_404_NOT_FOUND)
-        ShoppingCart.objects.get(recipe=recipe).delete()
-        return Response('Рецепт успешно удалён из списка покупок.',
-                        status=status.HTTP_204_NO_CONTENT)
+            return self.batch_response(
+                request, toggle.add_many(request.user.pk, ids), ADDED)
+        return self.batch_response(
+            request, toggle.remove_many(request.user.pk, ids), REMOVED)
+
+    def batch_response(self, request, results, changed):
+        if changed in results.values():
+            invalidate_membership(request)
+        return Response({'results': [
+            {'id': pk, 'status': result} for pk, result in results.items()]})
+
+    @action(detail=False,
+            methods=['post', 'delete'],
+            url_path='favorite/batch',
+            permission_classes=[IsAuthenticated])
+    def favorite_batch(self, request):
+        """Добавить / удалить несколько рецептов в избранном."""
+        return self.toggle_batch(request, FAVORITE)
+
+    @action(detail=False,
+            methods=['post', 'delete'],
+            url_path='shopping_cart/batch',
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_batch(self, request):
+        """Добавить / удалить несколько рецептов в списке покупок."""
+        return self.toggle_batch(request, SHOPPING_CART)
+
+    @action(detail=False,
+            methods=['post'],
+            url_path='shopping_cart/clear',
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_clear(self, request):
+        """Очистить список покупок; в итоге - удалённые рецепты."""
+        return self.batch_response(
+            request, SHOPPING_CART.remove_many(request.user.pk), REMOVED)
 
     @action(detail=False,
             methods=['get'],
             permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """
+        Лента рецептов авторов из подписок текущего пользователя,
+        новые выше. Вывод по ключу: ?cursor= из ссылки next, ?limit=.
+        """
+        paginator = FeedPagination()
+        ids = paginator.paginate_ids(
+            partial(FeedItem.objects.page, request.user), request)
+        recipes = self.get_queryset().filter(pk__in=ids).order_by('-id')
+        serializer = self.get_serializer(recipes, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=[IsAuthenticated],
+            renderer_classes=[PlainTextRenderer, CSVRenderer, JSONRenderer])
     def download_shopping_cart(self, request):
         """
         Скачать список покупок для выбранных рецептов,
-        данные суммируются.
+        данные суммируются. Формат: ?format=txt|csv|json.
         """
-        author = User.objects.get(id=self.request.user.pk)
+        author = self.request.user
         if author.shopping_cart.exists():
             return shopping_cart(self, request, author)
         return Response('Список покупок пуст.',
                         status=status.HTTP_404_NOT_FOUND)
+
+
+class MetricsView(APIView):
+    """Показатели запросов по действиям API в формате Prometheus."""
+    permission_classes = (IsAdminUser, )
+
+    def get(self, request):
+        return HttpResponse(
+            registry.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8')
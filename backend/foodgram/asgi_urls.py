@@ -0,0 +1,11 @@
+"""
+URL-ы для ASGI: чтение тегов и ингредиентов обслуживают асинхронные
+представления (api.async_views), остальное - как под WSGI.
+"""
+from django.urls import include, path
+
+from foodgram.urls import urlpatterns as wsgi_urlpatterns
+
+urlpatterns = [
+    path('api/', include('api.async_urls')),
+] + wsgi_urlpatterns
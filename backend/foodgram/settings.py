@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.metrics.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,7 +55,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'foodgram.urls'
+ROOT_URLCONF = os.getenv('ROOT_URLCONF', 'foodgram.urls')
 
 TEMPLATES = [
     {
@@ -88,6 +89,15 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -136,6 +146,68 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 }
+
+# Время жизни кеша избранного / корзины / подписок пользователя между
+# запросами в секундах. 0 - только в пределах запроса.
+MEMBERSHIP_CACHE_TIMEOUT = int(os.getenv('MEMBERSHIP_CACHE_TIMEOUT', 0))
+
+# Каталог ингредиентов (список, автодополнение, карточка, проверка
+# состава рецепта - только при общем CACHE_BACKEND): 'memory' - снимок
+# в памяти процесса (api.catalog), 'db' - запросы к БД с индексами
+# по UPPER(name).
+INGREDIENT_SEARCH_BACKEND = os.getenv('INGREDIENT_SEARCH_BACKEND', 'memory')
+
+# Кеш пользователей по токену (api.authentication): общий кеш, секунд
+# (0 - запрос к БД на каждый запрос), и LRU процесса. Сброс при выходе
+# и изменении пользователя доходит до других процессов только через
+# общий бэкенд CACHE_BACKEND, поэтому с кешем в памяти процесса
+# (LocMemCache, DummyCache) по умолчанию кеш выключен; LRU процесса
+# живёт TOKEN_CACHE_LOCAL_TIMEOUT секунд. Массовые изменения в обход
+# save() - User.objects.filter(...).update(is_active=False) - кеш
+# не сбрасывают: после них нужен invalidate_user_tokens(pk).
+TOKEN_CACHE_TIMEOUT = int(os.getenv(
+    'TOKEN_CACHE_TIMEOUT',
+    0 if CACHES['default']['BACKEND'].endswith(('LocMemCache', 'DummyCache'))
+    else 300))
+TOKEN_CACHE_LOCAL_TIMEOUT = int(os.getenv('TOKEN_CACHE_LOCAL_TIMEOUT', 5))
+TOKEN_CACHE_LOCAL_SIZE = int(os.getenv('TOKEN_CACHE_LOCAL_SIZE', 1024))
+
+# Кеш сериализованных ответов справочников и карточек рецептов.
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 600))
+
+# Бюджеты SQL-запросов на действие API. При превышении - предупреждение
+# в лог, при QUERY_BUDGET_STRICT (тесты) - исключение QueryBudgetExceeded.
+QUERY_BUDGETS = {
+    'RecipeViewSet.list': 8,
+    'RecipeViewSet.retrieve': 7,
+    'UserViewSet.subscriptions': 5,
+    'RecipeViewSet.feed': 9,
+    'TagViewSet.list': 2,
+    'IngredientViewSet.list': 2,
+}
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', '') == '1'
+
+# Уменьшенные копии изображений рецептов (recipes.images).
+# RECIPE_IMAGE_WORKERS = 0 - обработка в потоке запроса.
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+RECIPE_IMAGE_FORMAT = os.getenv('RECIPE_IMAGE_FORMAT', 'WEBP')
+RECIPE_IMAGE_QUALITY = int(os.getenv('RECIPE_IMAGE_QUALITY', 80))
+RECIPE_THUMB_SIZE = int(os.getenv('RECIPE_THUMB_SIZE', 400))
+RECIPE_DETAIL_SIZE = int(os.getenv('RECIPE_DETAIL_SIZE', 1200))
+
+# Лента подписок (recipes.models.FeedItem): рецепты авторов, у которых
+# подписчиков больше FEED_FANOUT_LIMIT, читаются из Recipe при запросе.
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+# Сколько последних рецептов автора раскладывается при отписке,
+# когда подписчиков снова стало FEED_FANOUT_LIMIT.
+FEED_REFILL_DEPTH = int(os.getenv('FEED_REFILL_DEPTH', 20))
+
+# Загрузка изображений рецептов (api.fields.StreamingImageField).
+RECIPE_IMAGE_MAX_SIZE = int(os.getenv('RECIPE_IMAGE_MAX_SIZE', 5 * 1024 ** 2))
+RECIPE_IMAGE_MAX_PIXELS = int(os.getenv('RECIPE_IMAGE_MAX_PIXELS', 40_000_000))
+# Запас на остальные поля рецепта в проверке Content-Length, байт.
+RECIPE_UPLOAD_OVERHEAD = 64 * 1024
@@ -1,7 +1,63 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
 from .models import (Favorite, Follow, Ingredient, IngredientRecipe,
-                     Recipe, ShoppingCart, Tag,)
+                     Recipe, ShoppingCart, ShoppingListItem, Tag,
+                     search_document)
+
+# Ниже этого числа строк таблица считается точно, COUNT(*) дешёвый.
+ESTIMATE_MIN_ROWS = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор админки: для таблицы PostgreSQL без фильтров число строк
+    берётся из статистики pg_class.reltuples вместо COUNT(*),
+    который на миллионах строк читает всю таблицу.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class '
+                    'WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] >= ESTIMATE_MIN_ROWS:
+                return row[0]
+        return super().count
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """
+    Основа админ-зон больших таблиц: оценка числа строк и без
+    второго COUNT(*) по всей таблице при поиске и фильтрах.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+def recipe_amounts(recipe_id):
+    return dict(IngredientRecipe.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient_id', 'amount'))
+
+
+def sync_shopping_lists(recipe_ids, save):
+    """
+    Изменение состава рецептов из админки - в сводные списки
+    покупок корзин с этими рецептами (как RecipeWriteSerializer.update).
+    """
+    old = {pk: recipe_amounts(pk) for pk in recipe_ids if pk}
+    save()
+    for pk, amounts in old.items():
+        ShoppingListItem.objects.change_recipe(
+            pk, amounts, recipe_amounts(pk))
 
 
 class IngredientsInline(admin.TabularInline):
@@ -11,60 +67,100 @@ class IngredientsInline(admin.TabularInline):
     """
     model = IngredientRecipe
     extra = 3
+    autocomplete_fields = ('ingredient',)
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(ScalableAdmin):
     """
     Админ-зона подписок.
     """
     list_display = ('user', 'author')
-    list_filter = ('author',)
-    search_fields = ('user',)
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    search_fields = ('^user__username', '^author__username')
 
 
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(ScalableAdmin):
     """
     Админ-зона избранных рецептов.
     """
     list_display = ('author', 'recipe')
-    list_filter = ('author',)
-    search_fields = ('author',)
+    list_select_related = ('author', 'recipe')
+    autocomplete_fields = ('author', 'recipe')
+    search_fields = ('^author__username', '^recipe__name')
 
 
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(ScalableAdmin):
     """
     Админ-зона покупок.
     """
     list_display = ('author', 'recipe')
-    list_filter = ('author',)
-    search_fields = ('author',)
+    list_select_related = ('author', 'recipe')
+    autocomplete_fields = ('author', 'recipe')
+    search_fields = ('^author__username', '^recipe__name')
 
 
-class IngredientRecipeAdmin(admin.ModelAdmin):
+class IngredientRecipeAdmin(ScalableAdmin):
     """
     Админ-зона ингридентов для рецептов.
     """
     list_display = ('id', 'recipe', 'ingredient', 'amount',)
-    list_filter = ('recipe', 'ingredient')
-    search_fields = ('name',)
+    list_select_related = ('recipe', 'ingredient')
+    autocomplete_fields = ('recipe', 'ingredient')
+    search_fields = ('^recipe__name', '^ingredient__name')
 
+    def save_model(self, request, obj, form, change):
+        sync_shopping_lists(
+            {obj.recipe_id, form.initial.get('recipe')},
+            lambda: super(IngredientRecipeAdmin, self).save_model(
+                request, obj, form, change))
 
-class RecipeAdmin(admin.ModelAdmin):
+    def delete_model(self, request, obj):
+        sync_shopping_lists(
+            {obj.recipe_id},
+            lambda: super(IngredientRecipeAdmin, self).delete_model(
+                request, obj))
+
+    def delete_queryset(self, request, queryset):
+        sync_shopping_lists(
+            set(queryset.values_list('recipe_id', flat=True)),
+            lambda: super(IngredientRecipeAdmin, self).delete_queryset(
+                request, queryset))
+
+
+class RecipeAdmin(ScalableAdmin):
     """
     Админ-зона рецептов.
     Добавлен просмотр кол-ва добавленных рецептов в избранное.
     """
     list_display = ('id', 'author', 'name', 'pub_date', 'in_favorite', )
+    list_select_related = ('author',)
     search_fields = ('name',)
-    list_filter = ('pub_date', 'author', 'name', 'tags')
-    filter_horizontal = ('ingredients',)
+    list_filter = ('pub_date', 'tags')
+    autocomplete_fields = ('author',)
     empty_value_display = '-пусто-'
     inlines = [IngredientsInline]
 
+    def save_related(self, request, form, formsets, change):
+        """
+        Состав из inline - в сводные списки покупок, поисковый
+        текст - после сохранения ингредиентов.
+        """
+        recipe = form.instance
+        sync_shopping_lists(
+            {recipe.pk} if change else set(),
+            lambda: super(RecipeAdmin, self).save_related(
+                request, form, formsets, change))
+        recipe.search_document = search_document(
+            recipe.name, recipe.text,
+            recipe.ingredients.values_list('name', flat=True))
+        recipe.save(update_fields=['search_document'])
+
     def in_favorite(self, obj):
-        return obj.favorite.all().count()
+        return obj.favorites_count
 
     in_favorite.short_description = 'Добавленные рецепты в избранное'
+    in_favorite.admin_order_field = 'favorites_count'
 
 
 class TagAdmin(admin.ModelAdmin):
@@ -76,12 +172,11 @@ class TagAdmin(admin.ModelAdmin):
     search_fields = ('name',)
 
 
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(ScalableAdmin):
     """
     Админ-зона ингридиентов.
     """
     list_display = ('name', 'measurement_unit')
-    list_filter = ('name',)
     search_fields = ('name',)
 
 
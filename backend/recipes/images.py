@@ -0,0 +1,135 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+_lock = Lock()
+_executor = None
+_pending = set()
+
+
+def image_format():
+    """WebP, если Pillow собран с его поддержкой, иначе JPEG."""
+    fmt = settings.RECIPE_IMAGE_FORMAT.upper()
+    if fmt == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return fmt
+
+
+def renditions():
+    """Поля уменьшенных копий и наибольшая сторона каждой, px."""
+    return {
+        'image_thumb': settings.RECIPE_THUMB_SIZE,
+        'image_detail': settings.RECIPE_DETAIL_SIZE,
+    }
+
+
+def rendition_name(recipe, field_name):
+    """Имя файла копии: от имени оригинала, чтобы оно не менялось."""
+    stem = os.path.splitext(os.path.basename(recipe.image.name))[0]
+    suffix = field_name.split('_')[-1]
+    filename = f'{stem}_{suffix}.{EXTENSIONS[image_format()]}'
+    return recipe._meta.get_field(field_name).generate_filename(
+        recipe, filename)
+
+
+def needs_renditions(recipe):
+    return bool(recipe.image) and any(
+        getattr(recipe, name).name != rendition_name(recipe, name)
+        for name in renditions())
+
+
+def encode(image, size):
+    """
+    Уменьшенная копия не больше size по наибольшей стороне,
+    без EXIF, ICC и прочих метаданных.
+    """
+    copy = image.copy()
+    copy.thumbnail((size, size), Image.LANCZOS)
+    fmt = image_format()
+    if fmt == 'JPEG' or copy.mode not in ('RGB', 'RGBA'):
+        has_alpha = fmt != 'JPEG' and (
+            'A' in copy.mode or 'transparency' in copy.info)
+        copy = copy.convert('RGBA' if has_alpha else 'RGB')
+    copy.info = {}
+    buffer = BytesIO()
+    copy.save(buffer, fmt, quality=settings.RECIPE_IMAGE_QUALITY)
+    return ContentFile(buffer.getvalue())
+
+
+def render(recipe):
+    """Создать уменьшенные копии изображения рецепта и сохранить их."""
+    with recipe.image.open('rb') as file, Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        for field_name, size in renditions().items():
+            name = rendition_name(recipe, field_name)
+            field_file = getattr(recipe, field_name)
+            if field_file.name and field_file.name != name:
+                field_file.storage.delete(field_file.name)
+            if field_file.storage.exists(name):
+                field_file.storage.delete(name)
+            field_file.save(
+                os.path.basename(name), encode(image, size), save=False)
+    recipe.save(update_fields=list(renditions()))
+
+
+def process(recipe_id):
+    """Задача пула: рецепт перечитывается, он мог измениться или удалиться."""
+    from recipes.models import Recipe
+    try:
+        recipe = Recipe.objects.filter(pk=recipe_id).first()
+        if recipe is not None and needs_renditions(recipe):
+            render(recipe)
+    except Exception:
+        logger.exception('Не удалось обработать изображение рецепта %s',
+                         recipe_id)
+    finally:
+        if settings.RECIPE_IMAGE_WORKERS:
+            connection.close()
+
+
+def submit(recipe_id):
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images')
+        future = _executor.submit(process, recipe_id)
+        _pending.add(future)
+    future.add_done_callback(_done)
+
+
+def _done(future):
+    with _lock:
+        _pending.discard(future)
+
+
+def schedule(recipe):
+    """
+    Поставить обработку изображения в очередь после фиксации транзакции.
+    При RECIPE_IMAGE_WORKERS = 0 обработка идёт сразу, в том же потоке.
+    Задачи живут в памяти процесса: пропущенные при перезапуске копии
+    создаёт команда generate_recipe_images.
+    """
+    if not settings.RECIPE_IMAGE_WORKERS:
+        transaction.on_commit(lambda: process(recipe.pk))
+    else:
+        transaction.on_commit(lambda: submit(recipe.pk))
+
+
+def wait_pending(timeout=None):
+    """Дождаться поставленных в очередь задач."""
+    with _lock:
+        pending = list(_pending)
+    wait(pending, timeout=timeout)
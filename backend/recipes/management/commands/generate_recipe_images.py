@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import needs_renditions, render
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Уменьшенные копии изображений рецептов, которых нет или которые
+    сделаны для прежнего изображения (задача потерялась при перезапуске,
+    рецепты созданы до появления копий).
+    """
+    help = 'Создаёт недостающие уменьшенные копии изображений рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать копии у всех рецептов.')
+
+    def handle(self, *args, **options):
+        done = failed = 0
+        recipes = Recipe.objects.exclude(image='').only(
+            'id', 'image', 'image_thumb', 'image_detail')
+        for recipe in recipes.iterator():
+            if not options['force'] and not needs_renditions(recipe):
+                continue
+            try:
+                render(recipe)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'Рецепт {recipe.pk}: {error}')
+                continue
+            done += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано изображений: {done}, с ошибкой: {failed}.'))
@@ -0,0 +1,231 @@
+import csv
+import io
+import json
+import os
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.versions import bump_version_on_commit
+from recipes.models import Ingredient, Tag
+
+DATA_DIR = os.path.join(os.path.dirname(settings.BASE_DIR), 'data')
+DEFAULT_PATHS = (
+    os.path.join(DATA_DIR, 'tags.csv'),
+    os.path.join(DATA_DIR, 'ingredients.csv'),
+)
+FIXTURE_MODELS = {'recipes.ingredient': 'ingredient', 'recipes.tag': 'tag'}
+
+
+def read_csv(file):
+    """Строки name,unit - ингредиенты, name,color,slug - теги."""
+    for row in csv.reader(file):
+        row = [value.strip() for value in row]
+        if len(row) == 2:
+            yield 'ingredient', {
+                'name': row[0], 'measurement_unit': row[1]}
+        elif len(row) == 3:
+            yield 'tag', {'name': row[0], 'color': row[1], 'slug': row[2]}
+        elif any(row):
+            yield None, row
+
+
+def iter_json_array(file, chunk_size=1 << 16):
+    """
+    Элементы JSON-массива верхнего уровня по одному,
+    файл читается кусками и целиком в память не загружается.
+    """
+    decoder = json.JSONDecoder()
+    buffer = file.read(chunk_size).lstrip()
+    if not buffer:
+        return
+    if not buffer.startswith('['):
+        raise CommandError(f'{file.name}: ожидается JSON-массив.')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip()
+        if buffer.startswith(','):
+            buffer = buffer[1:].lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                raise CommandError(f'{file.name}: JSON обрывается.')
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def read_json(file):
+    """Список ингредиентов ({name, measurement_unit}) или фикстура."""
+    for item in iter_json_array(file):
+        if 'model' in item:
+            yield FIXTURE_MODELS.get(item['model']), item.get('fields', {})
+        elif 'measurement_unit' in item:
+            yield 'ingredient', item
+        elif 'slug' in item:
+            yield 'tag', item
+        else:
+            yield None, item
+
+
+READERS = {'.csv': read_csv, '.json': read_json}
+
+
+class CatalogLoader:
+    """
+    Идемпотентная загрузка ингредиентов и тегов пачками.
+    Ингредиент определяется парой (название, единица), тег - слагом.
+    Уже существующие ключи читаются одним запросом, новые строки
+    вставляются bulk_create (на PostgreSQL - через COPY),
+    у существующих тегов обновляются изменившиеся поля.
+    """
+
+    def __init__(self, batch_size, log):
+        self.batch_size = batch_size
+        self.log = log
+        self.stats = Counter()
+        self.ingredients = set(Ingredient.objects.values_list(
+            'name', 'measurement_unit'))
+        self.tags = {tag.slug: tag for tag in Tag.objects.all()}
+        self.new_ingredients = []
+        self.new_tags = []
+        self.changed_tags = {}
+
+    def add(self, kind, fields):
+        if kind == 'ingredient':
+            self.add_ingredient(fields)
+        elif kind == 'tag':
+            self.add_tag(fields)
+        else:
+            self.stats['skipped'] += 1
+
+    def add_ingredient(self, fields):
+        key = (str(fields['name']).strip(),
+               str(fields['measurement_unit']).strip())
+        if key in self.ingredients:
+            self.stats['ingredients_unchanged'] += 1
+            return
+        self.ingredients.add(key)
+        self.new_ingredients.append(key)
+        if len(self.new_ingredients) >= self.batch_size:
+            self.flush_ingredients()
+
+    def add_tag(self, fields):
+        values = {'name': fields['name'], 'color': fields['color']}
+        tag = self.tags.get(fields['slug'])
+        if tag is None:
+            tag = self.tags[fields['slug']] = Tag(
+                slug=fields['slug'], **values)
+            self.new_tags.append(tag)
+        elif any(getattr(tag, name) != value
+                 for name, value in values.items()):
+            for name, value in values.items():
+                setattr(tag, name, value)
+            if tag.pk is not None:
+                self.changed_tags[tag.slug] = tag
+        else:
+            self.stats['tags_unchanged'] += 1
+
+    def flush_ingredients(self):
+        if not self.new_ingredients:
+            return
+        if connection.vendor == 'postgresql':
+            copy_ingredients(self.new_ingredients)
+        else:
+            Ingredient.objects.bulk_create(
+                [Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in self.new_ingredients],
+                batch_size=self.batch_size)
+        self.stats['ingredients_created'] += len(self.new_ingredients)
+        self.new_ingredients = []
+        self.log(f'Ингредиентов добавлено: '
+                 f'{self.stats["ingredients_created"]}')
+
+    def flush_tags(self):
+        Tag.objects.bulk_create(self.new_tags)
+        Tag.objects.bulk_update(self.changed_tags.values(), ['name', 'color'])
+        self.stats['tags_created'] += len(self.new_tags)
+        self.stats['tags_updated'] += len(self.changed_tags)
+        self.new_tags = []
+        self.changed_tags = {}
+
+    def finish(self):
+        self.flush_ingredients()
+        self.flush_tags()
+        if self.stats['ingredients_created']:
+            bump_version_on_commit('ingredient')
+        if self.stats['tags_created'] or self.stats['tags_updated']:
+            bump_version_on_commit('tag')
+
+
+def copy_ingredients(rows):
+    """Вставка ингредиентов одной командой COPY ... FROM STDIN."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    quote = connection.ops.quote_name
+    meta = Ingredient._meta
+    columns = ', '.join(
+        quote(meta.get_field(name).column)
+        for name in ('name', 'measurement_unit'))
+    with connection.cursor() as cursor:
+        cursor.cursor.copy_expert(
+            f'COPY {quote(meta.db_table)} ({columns}) '
+            f'FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+class Command(BaseCommand):
+    """
+    Потоковая загрузка ингредиентов и тегов из CSV, JSON-списков
+    и фикстур dumpdata без построчного сохранения и сигналов.
+    Повторный запуск с теми же файлами ничего не меняет.
+    """
+    help = 'Загружает ингредиенты и теги из CSV / JSON файлов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='*', default=DEFAULT_PATHS,
+            help='Файлы .csv / .json, по умолчанию data/tags.csv '
+                 'и data/ingredients.csv.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        started = time.perf_counter()
+        with transaction.atomic():
+            loader = CatalogLoader(options['batch_size'], self.progress)
+            for path in options['paths']:
+                self.load_file(loader, path)
+            loader.finish()
+        stats = loader.stats
+        self.stdout.write(self.style.SUCCESS(
+            f'Ингредиенты: добавлено {stats["ingredients_created"]}, '
+            f'без изменений {stats["ingredients_unchanged"]}. '
+            f'Теги: добавлено {stats["tags_created"]}, '
+            f'обновлено {stats["tags_updated"]}, '
+            f'без изменений {stats["tags_unchanged"]}. '
+            f'Пропущено записей: {stats["skipped"]}. '
+            f'Время: {time.perf_counter() - started:.2f} с.'))
+
+    def load_file(self, loader, path):
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError(f'{path}: поддерживаются только .csv и .json.')
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден.')
+        with open(path, encoding='utf-8', newline='') as file:
+            for kind, fields in reader(file):
+                loader.add(kind, fields)
+        self.progress(f'{path}: прочитан.')
+
+    def progress(self, message):
+        if self.verbosity >= 1:
+            self.stdout.write(message)
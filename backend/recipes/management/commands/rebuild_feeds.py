@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import FeedItem
+
+
+class Command(BaseCommand):
+    """
+    Пересборка лент подписок из подписок и рецептов.
+    Нужна после изменения FEED_FANOUT_LIMIT и массовых операций
+    в обход сигналов.
+    """
+    help = 'Пересобирает ленты подписок.'
+
+    def handle(self, *args, **options):
+        FeedItem.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Ленты подписок пересобраны: {FeedItem.objects.count()} строк.'))
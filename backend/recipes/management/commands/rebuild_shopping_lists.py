@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    """
+    Пересборка сводных списков покупок из корзин пользователей.
+    С ключом --verify только сверяет таблицу с живой агрегацией.
+    """
+    help = 'Пересобирает или сверяет сводные списки покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Только сверить сводные списки с корзинами.')
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            ShoppingListItem.objects.rebuild()
+            self.stdout.write(self.style.SUCCESS(
+                'Сводные списки покупок пересобраны: '
+                f'{ShoppingListItem.objects.count()} строк.'))
+            return
+        expected = {
+            (author_id, pk): total for author_id, pk, total
+            in ShoppingListItem.objects.live_totals()}
+        stored = {
+            (author_id, pk): amount for author_id, pk, amount
+            in ShoppingListItem.objects.values_list(
+                'author_id', 'ingredient_id', 'amount')}
+        mismatches = [
+            (key, stored.get(key), expected.get(key))
+            for key in expected.keys() | stored.keys()
+            if stored.get(key) != expected.get(key)]
+        for (author_id, pk), actual, total in sorted(mismatches):
+            self.stdout.write(
+                f'user={author_id} ingredient={pk}: '
+                f'в таблице {actual}, в корзине {total}')
+        if mismatches:
+            raise CommandError(
+                f'Расхождений в сводных списках: {len(mismatches)}.')
+        self.stdout.write(self.style.SUCCESS(
+            'Сводные списки покупок совпадают с корзинами.'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import refresh_counters
+
+
+class Command(BaseCommand):
+    """
+    Сверка счётчиков рецептов и пользователей с таблицами избранного,
+    корзин и рецептов. Запускается периодически, исправляет расхождения
+    после массовых операций в обход сигналов.
+    """
+    help = 'Исправляет или сверяет счётчики избранного, корзин и рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Только сверить счётчики, ничего не меняя.')
+
+    def handle(self, *args, **options):
+        drift = refresh_counters(verify=options['verify'])
+        for label, rows in drift.items():
+            self.stdout.write(f'{label}: расхождений {rows}')
+        total = sum(drift.values())
+        if options['verify'] and total:
+            raise CommandError(f'Расхождений в счётчиках: {total}.')
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счётчиков: {total}.' if total
+            else 'Счётчики совпадают с таблицами.'))
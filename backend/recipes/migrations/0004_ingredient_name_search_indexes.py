@@ -0,0 +1,44 @@
+# Generated by Django 3.2.6 on 2026-10-18 19:31
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+POSTGRES_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_upper_like '
+    'ON recipes_ingredient (UPPER(name) varchar_pattern_ops)',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_upper_trgm '
+    'ON recipes_ingredient USING gin (UPPER(name) gin_trgm_ops)',
+)
+
+
+def create_indexes(apps, schema_editor):
+    # istartswith / icontains в PostgreSQL - это UPPER(name) LIKE ...,
+    # обычный B-tree индекс по name для них не используется.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in POSTGRES_INDEXES:
+        schema_editor.execute(sql)
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'DROP INDEX IF EXISTS recipes_ingredient_name_upper_like')
+    schema_editor.execute(
+        'DROP INDEX IF EXISTS recipes_ingredient_name_upper_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_shoppinglistitem'),
+    ]
+
+    # Расширение pg_trgm создаёт суперпользователь. Если у владельца
+    # базы таких прав нет, администратор БД создаёт его заранее:
+    # CREATE EXTENSION pg_trgm; - тогда операция его только проверит.
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.6 on 2026-10-18 19:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_ingredient_name_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_detail',
+            field=models.ImageField(blank=True, editable=False, upload_to='media/thumbs/', verbose_name='Изображение для страницы рецепта'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_thumb',
+            field=models.ImageField(blank=True, editable=False, upload_to='media/thumbs/', verbose_name='Миниатюра для списков'),
+        ),
+    ]
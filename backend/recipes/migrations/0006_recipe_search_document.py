@@ -0,0 +1,55 @@
+# Generated by Django 3.2.6 on 2026-10-18 20:05
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+# Выражение должно совпадать с тем, что строит SearchVector
+# в api.search, иначе PostgreSQL не использует индекс.
+CREATE_INDEX = (
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_search_document_gin '
+    'ON recipes_recipe USING gin '
+    "(to_tsvector('russian'::regconfig, COALESCE(search_document, '')))")
+DROP_INDEX = 'DROP INDEX IF EXISTS recipes_recipe_search_document_gin'
+
+
+def fill_search_documents(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    names = defaultdict(list)
+    for recipe_id, name in IngredientRecipe.objects.values_list(
+            'recipe_id', 'ingredient__name'):
+        names[recipe_id].append(name)
+    recipes = list(Recipe.objects.only('id', 'name', 'text'))
+    for recipe in recipes:
+        recipe.search_document = '\n'.join((
+            recipe.name, ', '.join(sorted(names[recipe.pk])),
+            recipe.text)).lower()
+    Recipe.objects.bulk_update(recipes, ['search_document'], batch_size=500)
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_INDEX)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_document',
+            field=models.TextField(blank=True, editable=False, verbose_name='Текст для поиска'),
+        ),
+        migrations.RunPython(fill_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.6 on 2026-10-18 19:29
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+TAG_MASK_BITS = 63
+
+
+def fill_tags_masks(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    masks = defaultdict(int)
+    for recipe_id, tag_id in Recipe.tags.through.objects.values_list(
+            'recipe_id', 'tag_id'):
+        if 0 < tag_id <= TAG_MASK_BITS:
+            masks[recipe_id] |= 1 << (tag_id - 1)
+    Recipe.objects.bulk_update(
+        [Recipe(pk=pk, tags_mask=mask) for pk, mask in masks.items()],
+        ['tags_mask'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_search_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Битовая маска тегов'),
+        ),
+        migrations.RunPython(fill_tags_masks, migrations.RunPython.noop),
+    ]
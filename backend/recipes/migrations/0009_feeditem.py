@@ -0,0 +1,52 @@
+# Generated by Django 3.2.6 on 2026-10-18 19:35
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def fill_feeds(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Follow = apps.get_model('recipes', 'Follow')
+    FeedItem = apps.get_model('recipes', 'FeedItem')
+    User.objects.update(followers_count=Coalesce(Subquery(
+        Follow.objects.filter(author=OuterRef('pk')).order_by()
+        .values('author').annotate(total=Count('pk')).values('total')), 0))
+    FeedItem.objects.bulk_create(
+        (FeedItem(user_id=user_id, recipe_id=recipe_id)
+         for user_id, recipe_id in Follow.objects.filter(
+             author__followers_count__lte=settings.FEED_FANOUT_LIMIT,
+             author__recipe__isnull=False,
+         ).values_list('user_id', 'author__recipe').iterator()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_recipe_counters'),
+        ('users', '0003_user_followers_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to='recipes.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Лента подписок',
+                'verbose_name_plural': 'Ленты подписок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='feeditem',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_item'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
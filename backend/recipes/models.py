@@ -1,8 +1,15 @@
-from django.db import models
+from collections import Counter, defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import models, transaction
 from django.core.validators import MinValueValidator
-from django.db.models import Q, F
+from django.db.models import (Case, Count, Exists, F, IntegerField,
+                              OuterRef, Prefetch, Q, Subquery, Sum, Value,
+                              When)
+from django.db.models.functions import Coalesce
 
-from users.models import User
+from users.models import CountersMixin, User
 
 
 class Ingredient(models.Model):
@@ -59,10 +66,117 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+# Теги с id 1..TAG_MASK_BITS отмечаются битами Recipe.tags_mask
+# (BigInteger, знаковый бит не используется), остальные - только в M2M.
+TAG_MASK_BITS = 63
+
+
+def tag_bit(pk):
+    return 1 << (pk - 1) if 0 < pk <= TAG_MASK_BITS else 0
+
+
+def tags_mask(pks):
+    """Битовая маска тегов по их id."""
+    mask = 0
+    for pk in pks:
+        mask |= tag_bit(pk)
+    return mask
+
+
+def search_document(name, text, ingredient_names):
+    """
+    Текст для полнотекстового поиска рецепта: строка названия,
+    строка ингредиентов и описание, в нижнем регистре.
+    """
+    return '\n'.join((
+        name, ', '.join(sorted(ingredient_names)), text)).lower()
+
+
+class RecipeQuerySet(models.QuerySet):
+    """
+    Выборка рецептов для чтения.
+    Связанные объекты подгружаются фиксированным числом запросов,
+    флаги избранного, корзины и подписки считаются в самом SQL,
+    поэтому число запросов не зависит от размера страницы.
+    """
+
+    def with_related(self, user=None):
+        if user is None or user.is_anonymous:
+            authors = User.objects.annotate(is_subscribed=Value(False))
+        else:
+            authors = User.objects.annotate(is_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef('pk'))))
+        return self.prefetch_related(
+            Prefetch('author', queryset=authors),
+            'tags',
+            Prefetch('recipe_ingredients',
+                     queryset=IngredientRecipe.objects.select_related(
+                         'ingredient')))
+
+    def with_user_flags(self, user=None):
+        if user is None or user.is_anonymous:
+            return self.annotate(is_favorited=Value(False),
+                                 is_in_shopping_cart=Value(False))
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                author=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                author=user, recipe=OuterRef('pk'))))
+
+    def with_any_tag(self, tags):
+        """
+        Рецепты хотя бы с одним из тегов: (tags_mask & маска) > 0
+        без соединения с M2M и DISTINCT. Если среди тегов есть не
+        помещающиеся в маску - через M2M.
+        """
+        pks = {tag.pk for tag in tags}
+        if any(not tag_bit(pk) for pk in pks):
+            return self.filter(tags__in=pks).distinct()
+        return self.alias(
+            tag_hits=F('tags_mask').bitand(tags_mask(pks))
+        ).filter(tag_hits__gt=0)
+
+    def refresh_tags_masks(self, batch_size=500):
+        """Пересчитать tags_mask выбранных рецептов по таблице M2M."""
+        masks = defaultdict(int)
+        for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+                recipe__in=self).values_list('recipe_id', 'tag_id'):
+            masks[recipe_id] |= tag_bit(tag_id)
+        recipes = []
+        for recipe in self.only('id', 'tags_mask'):
+            if recipe.tags_mask != masks[recipe.pk]:
+                recipe.tags_mask = masks[recipe.pk]
+                recipes.append(recipe)
+        self.model.objects.bulk_update(
+            recipes, ['tags_mask'], batch_size=batch_size)
+        return len(recipes)
+
+    def refresh_search_documents(self, batch_size=500):
+        """
+        Пересчитать search_document выбранных рецептов по данным в БД
+        (после массовых операций и переименования ингредиентов).
+        """
+        names = defaultdict(list)
+        for recipe_id, name in IngredientRecipe.objects.filter(
+                recipe__in=self).values_list('recipe_id', 'ingredient__name'):
+            names[recipe_id].append(name)
+        recipes = []
+        for recipe in self.only('id', 'name', 'text', 'search_document'):
+            document = search_document(
+                recipe.name, recipe.text, names[recipe.pk])
+            if recipe.search_document != document:
+                recipe.search_document = document
+                recipes.append(recipe)
+        self.model.objects.bulk_update(
+            recipes, ['search_document'], batch_size=batch_size)
+        return len(recipes)
+
+
+class Recipe(CountersMixin, models.Model):
     """
     Модель для рецептов.
     У автора не может быть создано более одного рецепта с одним именем.
+    Счётчики избранного и корзин ведут обработчики recipes.signals.
     """
     author = models.ForeignKey(
         User,
@@ -93,20 +207,55 @@ class Recipe(models.Model):
         verbose_name='Картинка рецепта',
         upload_to='media/',
         help_text='Добавьте изображение рецепта')
+    image_thumb = models.ImageField(
+        verbose_name='Миниатюра для списков',
+        upload_to='media/thumbs/',
+        blank=True,
+        editable=False)
+    image_detail = models.ImageField(
+        verbose_name='Изображение для страницы рецепта',
+        upload_to='media/thumbs/',
+        blank=True,
+        editable=False)
     pub_date = models.DateTimeField(
         verbose_name='Дата публикации',
         auto_now_add=True)
+    search_document = models.TextField(
+        verbose_name='Текст для поиска',
+        blank=True,
+        editable=False)
+    tags_mask = models.BigIntegerField(
+        verbose_name='Битовая маска тегов',
+        default=0,
+        editable=False)
+    favorites_count = models.IntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False)
+    cart_count = models.IntegerField(
+        verbose_name='В списках покупок',
+        default=0,
+        editable=False)
+
+    objects = RecipeQuerySet.as_manager()
+    counter_fields = ('favorites_count', 'cart_count')
 
     class Meta:
         ordering = ['-id']
         default_related_name = 'recipe'
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['-favorites_count', '-id'],
+                         name='recipe_popular_idx')]
         constraints = [
             models.UniqueConstraint(
                 fields=['name', 'author'],
                 name='unique_recipe')]
 
+    def __str__(self):
+        return self.name
+
 
 class IngredientRecipe(models.Model):
     """
@@ -172,6 +321,104 @@ class ShoppingCart(models.Model):
         return f'{self.recipe}'
 
 
+class ShoppingListQuerySet(models.QuerySet):
+    """
+    Поддержка сводного списка покупок.
+    Изменения применяются как приращения количества ингредиентов
+    для набора пользователей, без пересчёта всей корзины.
+    """
+
+    def apply_deltas(self, author_ids, deltas):
+        """
+        Недостающие строки вставляются с нулём, пропуская уже
+        существующие (параллельная вставка той же строки не даёт
+        IntegrityError), затем приращения - одним UPDATE с F().
+        """
+        deltas = {pk: delta for pk, delta in deltas.items() if delta}
+        if not author_ids or not deltas:
+            return
+        with transaction.atomic():
+            self.bulk_create([
+                self.model(author_id=author_id, ingredient_id=pk, amount=0)
+                for author_id in author_ids
+                for pk, delta in deltas.items() if delta > 0],
+                ignore_conflicts=True)
+            self.filter(
+                author_id__in=author_ids, ingredient_id__in=deltas
+            ).update(amount=F('amount') + Case(
+                *[When(ingredient_id=pk, then=Value(delta))
+                  for pk, delta in deltas.items()],
+                output_field=IntegerField()))
+            self.filter(author_id__in=author_ids, amount__lte=0).delete()
+
+    def add_recipes(self, author_id, recipe_ids, sign=1):
+        deltas = Counter()
+        for pk, amount in IngredientRecipe.objects.filter(
+                recipe_id__in=recipe_ids).values_list(
+                    'ingredient_id', 'amount'):
+            deltas[pk] += sign * amount
+        self.apply_deltas([author_id], deltas)
+
+    def remove_recipes(self, author_id, recipe_ids):
+        self.add_recipes(author_id, recipe_ids, sign=-1)
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        """Перенос изменений состава рецепта в корзины с этим рецептом."""
+        deltas = Counter(new_amounts)
+        deltas.subtract(old_amounts)
+        author_ids = list(ShoppingCart.objects.filter(
+            recipe=recipe).values_list('author_id', flat=True))
+        self.apply_deltas(author_ids, deltas)
+
+    def live_totals(self):
+        """Эталонная агрегация по корзинам и составу рецептов."""
+        return IngredientRecipe.objects.filter(
+            recipe__shopping_cart__isnull=False
+        ).values_list(
+            'recipe__shopping_cart__author_id', 'ingredient_id'
+        ).annotate(total=Sum('amount')).order_by()
+
+    def rebuild(self, batch_size=1000):
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(
+                (self.model(author_id=author_id, ingredient_id=pk,
+                            amount=total)
+                 for author_id, pk, total in self.live_totals()),
+                batch_size=batch_size)
+
+
+class ShoppingListItem(models.Model):
+    """
+    Сводный список покупок пользователя.
+    Сумма количества ингредиента по всем рецептам корзины,
+    поддерживается при изменении корзины и состава рецептов.
+    """
+    author = models.ForeignKey(
+        User,
+        related_name='shopping_list',
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь')
+    ingredient = models.ForeignKey(
+        Ingredient,
+        related_name='shopping_list',
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент')
+    amount = models.IntegerField(verbose_name='Количество')
+
+    objects = ShoppingListQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Сводный список покупок'
+        verbose_name_plural = 'Сводные списки покупок'
+        constraints = [models.UniqueConstraint(
+            fields=['author', 'ingredient'],
+            name='unique_shopping_list_item')]
+
+    def __str__(self):
+        return f'{self.ingredient} {self.amount}'
+
+
 class Favorite(models.Model):
     """
     Список покупок пользователя.
@@ -232,3 +479,135 @@ class Follow(models.Model):
 
     def __str__(self):
         return f'Пользователь {self.user} подписан на {self.author}'
+
+
+class FeedQuerySet(models.QuerySet):
+    """
+    Лента подписок.
+    Рецепт раскладывается по лентам подписчиков при публикации,
+    кроме авторов, у которых подписчиков больше FEED_FANOUT_LIMIT:
+    их рецепты лента при чтении берёт прямо из Recipe.
+    """
+
+    def add_follows(self, batch_size=1000, **filters):
+        """Рецепты авторов по подпискам Follow.objects.filter(**filters)."""
+        rows = Follow.objects.filter(
+            author__followers_count__lte=settings.FEED_FANOUT_LIMIT,
+            author__recipe__isnull=False, **filters,
+        ).values_list('user_id', 'author__recipe').iterator()
+        while True:
+            batch = [self.model(user_id=user_id, recipe_id=recipe_id)
+                     for user_id, recipe_id in islice(rows, batch_size)]
+            if not batch:
+                return
+            self.bulk_create(batch, ignore_conflicts=True)
+
+    def fan_out(self, recipe):
+        self.add_follows(author__recipe=recipe.pk)
+
+    def refill(self, author_id):
+        """
+        Автор снова раскладывается: в ленты подписчиков - только
+        FEED_REFILL_DEPTH его последних рецептов, чтобы отписка
+        не вставляла все рецепты автора каждому подписчику.
+        Ленты целиком восстанавливает команда rebuild_feeds.
+        """
+        recipe_ids = list(Recipe.objects.filter(
+            author_id=author_id).order_by('-id').values_list(
+                'id', flat=True)[:settings.FEED_REFILL_DEPTH])
+        self.add_follows(author_id=author_id,
+                         author__recipe__in=recipe_ids)
+
+    def prune(self, user_id, author_ids):
+        self.filter(user_id=user_id,
+                    recipe__author_id__in=author_ids).delete()
+
+    def rebuild(self):
+        with transaction.atomic():
+            self.all().delete()
+            self.add_follows()
+
+    def page(self, user, before, size):
+        """
+        До size id рецептов ленты по убыванию, меньших before:
+        строки ленты, слитые с рецептами авторов без раскладки.
+        """
+        items = self.filter(user=user)
+        recipes = Recipe.objects.all()
+        if before is not None:
+            items = items.filter(recipe_id__lt=before)
+            recipes = recipes.filter(id__lt=before)
+        ids = list(items.order_by('-recipe_id').values_list(
+            'recipe_id', flat=True)[:size])
+        authors = list(Follow.objects.filter(
+            user=user,
+            author__followers_count__gt=settings.FEED_FANOUT_LIMIT,
+        ).values_list('author_id', flat=True))
+        if authors:
+            ids = sorted(set(ids).union(
+                recipes.filter(author_id__in=authors).order_by('-id')
+                .values_list('id', flat=True)[:size]), reverse=True)[:size]
+        return ids
+
+
+class FeedItem(models.Model):
+    """
+    Рецепт в ленте подписок пользователя.
+    Строки ведут обработчики recipes.signals: при публикации рецепта,
+    подписке и отписке.
+    """
+    user = models.ForeignKey(
+        User,
+        related_name='feed',
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь')
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='feed_items',
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт')
+
+    objects = FeedQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Лента подписок'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'recipe'],
+            name='unique_feed_item')]
+
+    def __str__(self):
+        return f'{self.recipe}'
+
+
+def counters():
+    """Счётчики: (выборка, поле, связанные строки, поле связи)."""
+    return (
+        (Recipe.objects, 'favorites_count', Favorite.objects, 'recipe'),
+        (Recipe.objects, 'cart_count', ShoppingCart.objects, 'recipe'),
+        (User.objects, 'recipes_count', Recipe.objects, 'author'),
+        (User.objects, 'followers_count', Follow.objects, 'author'),
+    )
+
+
+def actual_count(related, fk):
+    """Число связанных строк для OuterRef('pk') подзапросом."""
+    return Coalesce(Subquery(
+        related.filter(**{fk: OuterRef('pk')}).order_by().values(fk)
+        .annotate(total=Count('pk')).values('total')), 0)
+
+
+def refresh_counters(verify=False):
+    """
+    Исправить расхождения счётчиков с таблицами одним UPDATE на
+    счётчик. Возвращает {'модель.поле': число расходящихся строк},
+    с verify=True только считает их.
+    """
+    drift = {}
+    for queryset, field, related, fk in counters():
+        actual = actual_count(related, fk)
+        stale = queryset.exclude(**{field: actual})
+        label = f'{queryset.model._meta.label}.{field}'
+        drift[label] = (stale.count() if verify
+                        else stale.update(**{field: actual}))
+    return drift
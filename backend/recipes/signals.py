@@ -0,0 +1,114 @@
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from users.models import User
+from .images import needs_renditions, schedule
+from .models import (Favorite, FeedItem, Follow, Recipe, ShoppingCart, Tag,
+                     tag_bit, tags_mask)
+from .toggles import (cart_added, cart_removed, favorite_added,
+                      favorite_removed, follow_added, follow_removed,
+                      increment)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_added(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        cart_added(instance.author_id, [instance.recipe_id])
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def shopping_cart_removed(sender, instance, **kwargs):
+    cart_removed(instance.author_id, [instance.recipe_id])
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        favorite_added(instance.author_id, [instance.recipe_id])
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    favorite_removed(instance.author_id, [instance.recipe_id])
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_added(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        increment(User.objects.filter(pk=instance.author_id),
+                  'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_removed(sender, instance, **kwargs):
+    increment(User.objects.filter(pk=instance.author_id),
+              'recipes_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_fan_out(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        FeedItem.objects.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        follow_added(instance.user_id, [instance.author_id])
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    follow_removed(instance.user_id, [instance.author_id])
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, raw=False, **kwargs):
+    if not raw and needs_renditions(instance):
+        schedule(instance)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Recipe.tags_mask вслед за изменением тегов рецепта не из API."""
+    if reverse:
+        update_tag_recipes(instance, action, pk_set)
+        return
+    if action == 'post_clear':
+        mask = 0
+    elif action == 'post_add':
+        mask = instance.tags_mask | tags_mask(pk_set)
+    elif action == 'post_remove':
+        mask = instance.tags_mask & ~tags_mask(pk_set)
+    else:
+        return
+    if mask != instance.tags_mask:
+        instance.tags_mask = mask
+        Recipe.objects.filter(pk=instance.pk).update(tags_mask=mask)
+
+
+def update_tag_recipes(tag, action, pk_set):
+    bit = tag_bit(tag.pk)
+    if not bit:
+        return
+    if action == 'post_add':
+        Recipe.objects.filter(pk__in=pk_set).update(
+            tags_mask=F('tags_mask').bitor(bit))
+    elif action == 'post_remove':
+        Recipe.objects.filter(pk__in=pk_set).update(
+            tags_mask=F('tags_mask').bitand(~bit))
+    elif action == 'pre_clear':
+        Recipe.objects.filter(tags=tag).update(
+            tags_mask=F('tags_mask').bitand(~bit))
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    bit = tag_bit(instance.pk)
+    if bit:
+        Recipe.objects.alias(
+            tag_hits=F('tags_mask').bitand(bit)
+        ).filter(tag_hits__gt=0).update(
+            tags_mask=F('tags_mask').bitand(~bit))
@@ -0,0 +1,203 @@
+import sqlite3
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+from users.models import User
+from .models import (Favorite, FeedItem, Follow, Recipe, ShoppingCart,
+                     ShoppingListItem)
+
+
+def increment(queryset, field, delta):
+    """Атомарное приращение счётчика в БД, без чтения значения."""
+    queryset.update(**{field: F(field) + delta})
+
+
+def favorite_added(author_id, recipe_ids):
+    increment(Recipe.objects.filter(pk__in=recipe_ids), 'favorites_count', 1)
+
+
+def favorite_removed(author_id, recipe_ids):
+    increment(Recipe.objects.filter(pk__in=recipe_ids), 'favorites_count', -1)
+
+
+def cart_added(author_id, recipe_ids):
+    ShoppingListItem.objects.add_recipes(author_id, recipe_ids)
+    increment(Recipe.objects.filter(pk__in=recipe_ids), 'cart_count', 1)
+
+
+def cart_removed(author_id, recipe_ids):
+    ShoppingListItem.objects.remove_recipes(author_id, recipe_ids)
+    increment(Recipe.objects.filter(pk__in=recipe_ids), 'cart_count', -1)
+
+
+def follow_added(user_id, author_ids):
+    """Счётчик подписчиков, затем рецепты авторов - в ленту."""
+    increment(User.objects.filter(pk__in=author_ids), 'followers_count', 1)
+    FeedItem.objects.add_follows(user_id=user_id, author_id__in=author_ids)
+
+
+def follow_removed(user_id, author_ids):
+    """
+    Рецепты авторов убираются из ленты. Если у автора подписчиков
+    стало FEED_FANOUT_LIMIT, его последние рецепты, опубликованные
+    без раскладки, раскладываются по лентам оставшихся подписчиков.
+    """
+    authors = User.objects.filter(pk__in=author_ids)
+    increment(authors, 'followers_count', -1)
+    FeedItem.objects.prune(user_id, author_ids)
+    for author_id in authors.filter(
+            followers_count=settings.FEED_FANOUT_LIMIT).values_list(
+                'pk', flat=True):
+        FeedItem.objects.refill(author_id)
+
+
+def returning_supported():
+    if connection.vendor == 'sqlite':
+        return sqlite3.sqlite_version_info >= (3, 35)
+    return connection.features.can_return_rows_from_bulk_insert
+
+
+ADDED = 'added'
+EXISTS = 'exists'
+REMOVED = 'removed'
+NOT_FOUND = 'not_found'
+
+
+class Toggle:
+    """
+    Связь пользователя с объектом: избранное, корзина, подписка.
+    Добавление - один INSERT, пропускающий дубликат (ON CONFLICT
+    DO NOTHING / INSERT OR IGNORE), удаление - один DELETE; исход
+    решает число затронутых строк, гонки двойного клика не дают
+    IntegrityError. Пакетные add_many / remove_many делают проверку
+    и запись сразу для всего пакета. Сигналы модели при сыром SQL
+    не срабатывают, поэтому побочные эффекты added / removed
+    вызываются явно (их же вызывают обработчики recipes.signals).
+    """
+
+    def __init__(self, model, owner, target, added, removed):
+        self.model = model
+        self.owner = owner
+        self.target = target
+        self.added = added
+        self.removed = removed
+
+    def columns(self):
+        opts = self.model._meta
+        quote = connection.ops.quote_name
+        return (quote(opts.db_table),
+                quote(opts.get_field(self.owner).column),
+                quote(opts.get_field(self.target).column))
+
+    def execute(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
+
+    def insert_sql(self, rows=1):
+        """INSERT rows связей, пропускающий уже существующие."""
+        table, owner, target = self.columns()
+        ops = connection.ops
+        values = ', '.join(['(%s, %s)'] * rows)
+        return (f'{ops.insert_statement(ignore_conflicts=True)} {table} '
+                f'({owner}, {target}) VALUES {values} '
+                f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}')
+
+    def insert_many(self, owner_id, target_ids):
+        """
+        id объектов, связи с которыми действительно вставлены:
+        одним INSERT ... RETURNING, где он есть (PostgreSQL,
+        SQLite 3.35+), иначе по строке с проверкой rowcount.
+        """
+        if not returning_supported():
+            sql = self.insert_sql()
+            return [pk for pk in target_ids
+                    if self.execute(sql, [owner_id, pk]) > 0]
+        target = self.columns()[2]
+        params = [value for pk in target_ids for value in (owner_id, pk)]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'{self.insert_sql(len(target_ids))} RETURNING {target}',
+                params)
+            inserted = {row[0] for row in cursor.fetchall()}
+        return [pk for pk in target_ids if pk in inserted]
+
+    def add(self, owner_id, target_id):
+        """True, если связи не было и она создана."""
+        with transaction.atomic():
+            created = self.execute(
+                self.insert_sql(), [owner_id, target_id]) > 0
+            if created:
+                self.added(owner_id, [target_id])
+        return created
+
+    def remove(self, owner_id, target_id):
+        """True, если связь была и удалена."""
+        table, owner, target = self.columns()
+        sql = f'DELETE FROM {table} WHERE {owner} = %s AND {target} = %s'
+        with transaction.atomic():
+            deleted = self.execute(sql, [owner_id, target_id]) > 0
+            if deleted:
+                self.removed(owner_id, [target_id])
+        return deleted
+
+    def links(self, owner_id):
+        return self.model.objects.filter(**{self.owner: owner_id})
+
+    def add_many(self, owner_id, target_ids):
+        """
+        Пакетное добавление: проверка существования объектов, вставка
+        пакета и побочные эффекты в одной транзакции. Побочные эффекты
+        получают только действительно вставленные связи: при
+        параллельном добавлении тех же объектов они не применяются
+        дважды. Возвращает {id: ADDED | EXISTS | NOT_FOUND}.
+        """
+        target_ids = list(dict.fromkeys(target_ids))
+        related = self.model._meta.get_field(self.target).related_model
+        with transaction.atomic():
+            found = set(related.objects.filter(
+                pk__in=target_ids).values_list('pk', flat=True))
+            new = [pk for pk in target_ids if pk in found]
+            if new:
+                new = self.insert_many(owner_id, new)
+            if new:
+                self.added(owner_id, new)
+        new = set(new)
+        return {pk: ADDED if pk in new
+                else EXISTS if pk in found else NOT_FOUND
+                for pk in target_ids}
+
+    def remove_many(self, owner_id, target_ids=None):
+        """
+        Пакетное удаление одним DELETE (target_ids=None - всех связей
+        владельца). Возвращает {id: REMOVED | NOT_FOUND}.
+        """
+        links = self.links(owner_id)
+        if target_ids is not None:
+            target_ids = list(dict.fromkeys(target_ids))
+            links = links.filter(**{f'{self.target}__in': target_ids})
+        table, owner, target = self.columns()
+        with transaction.atomic():
+            removed = list(links.select_for_update().values_list(
+                f'{self.target}_id', flat=True))
+            if removed:
+                placeholders = ', '.join(['%s'] * len(removed))
+                self.execute(
+                    f'DELETE FROM {table} WHERE {owner} = %s '
+                    f'AND {target} IN ({placeholders})',
+                    [owner_id, *removed])
+                self.removed(owner_id, removed)
+        if target_ids is None:
+            target_ids = removed
+        removed = set(removed)
+        return {pk: REMOVED if pk in removed else NOT_FOUND
+                for pk in target_ids}
+
+
+FAVORITE = Toggle(Favorite, 'author', 'recipe',
+                  favorite_added, favorite_removed)
+SHOPPING_CART = Toggle(ShoppingCart, 'author', 'recipe',
+                       cart_added, cart_removed)
+FOLLOW = Toggle(Follow, 'user', 'author', follow_added, follow_removed)
@@ -1,15 +1,17 @@
 from django.contrib import admin
+
+from recipes.admin import ScalableAdmin
 from .models import User
 
 
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(ScalableAdmin):
     """
     Админ-зона пользователя.
     """
     list_display = ('id', 'username', 'first_name',
-                    'last_name', 'email', 'role', 'admin')
+                    'last_name', 'email', 'role', 'admin', 'recipes_count')
     search_fields = ('username', 'email')
-    list_filter = ('username', 'email',)
+    list_filter = ('role',)
     empty_value_display = '-пусто-'
 
 
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.6 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_recipes_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Число подписчиков'),
+        ),
+    ]
@@ -3,7 +3,26 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 
 
-class User(AbstractUser):
+class CountersMixin:
+    """
+    Счётчики counter_fields меняются только приращениями F() в БД.
+    Полное сохранение существующего объекта их не перезаписывает,
+    иначе прочитанное ранее значение затёрло бы чужие приращения.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not args
+                and kwargs.get('update_fields') is None):
+            skip = self.get_deferred_fields().union(self.counter_fields)
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in skip and field.attname not in skip]
+        super().save(*args, **kwargs)
+
+
+class User(CountersMixin, AbstractUser):
     """
     Кастомизированная модель пользователя.
     Регистрация с помощью email.
@@ -21,8 +40,13 @@ class User(AbstractUser):
     role = models.CharField(max_length=15, choices=ROLE_USER,
                             default=USER, verbose_name='Пользовательская роль')
     password = models.CharField(max_length=150, verbose_name='Пароль')
+    recipes_count = models.IntegerField(
+        'Число рецептов', default=0, editable=False)
+    followers_count = models.IntegerField(
+        'Число подписчиков', default=0, editable=False)
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'password', 'first_name', 'last_name']
+    counter_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -1,10 +1,18 @@
 from rest_framework import serializers
-from rest_framework import status
-from rest_framework.exceptions import ValidationError
 
-from recipes.models import Follow, Recipe
+from recipes.models import Follow
 from users.models import User
 import api.serializers
+from api.membership import get_membership
+from api.services import recipes_by_author
+
+
+def recipes_limit(request):
+    """Значение параметра ?recipes_limit= или None."""
+    limit = request.GET.get('recipes_limit')
+    if limit and limit.isdigit():
+        return int(limit)
+    return None
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -23,10 +31,10 @@ class UserSerializer(serializers.ModelSerializer):
                         'is_subscribed': {'read_only': True}}
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if not user.is_anonymous:
-            return Follow.objects.filter(user=user, author=obj).exists()
-        return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        membership = get_membership(self.context.get('request'))
+        return obj.pk in membership.following
 
     def create(self, validated_data):
         return User.objects.create_user(**validated_data)
@@ -41,7 +49,7 @@ class FollowSerializer(serializers.ModelSerializer):
     last_name = serializers.ReadOnlyField(source='author.last_name')
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField(source='author.recipes_count')
 
     class Meta:
         model = Follow
@@ -49,35 +57,17 @@ class FollowSerializer(serializers.ModelSerializer):
                   'last_name', 'is_subscribed', 'recipes', 'recipes_count')
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if not user.is_anonymous:
-            return Follow.objects.filter(
-                user=obj.user,
-                author=obj.author).exists()
-        return False
+        # obj - сама подписка, поэтому для её владельца флаг всегда истинен.
+        return not self.context.get('request').user.is_anonymous
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = Recipe.objects.filter(author=obj.author)
-        if limit and limit.isdigit():
-            recipes = recipes[:int(limit)]
-        return api.serializers.RecipeMiniSerializer(recipes, many=True).data
-
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
-
-    def validate(self, data):
-        author = self.context.get('author')
-        user = self.context.get('request').user
-        if Follow.objects.filter(
-                author=author,
-                user=user).exists():
-            raise ValidationError(
-                detail='Вы уже подписаны на этого пользователя!',
-                code=status.HTTP_400_BAD_REQUEST)
-        if user == author:
-            raise ValidationError(
-                detail='Невозможно подписаться на себя!',
-                code=status.HTTP_400_BAD_REQUEST)
-        return data
+        """
+        Рецепты автора. Для страницы подписок они заранее выбраны
+        одним запросом на всех авторов (context['recipes_by_author']).
+        """
+        grouped = self.context.get('recipes_by_author')
+        if grouped is None:
+            grouped = recipes_by_author(
+                [obj.author_id], recipes_limit(self.context.get('request')))
+        return api.serializers.RecipeMiniSerializer(
+            grouped.get(obj.author_id, []), many=True).data
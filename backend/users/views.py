@@ -2,18 +2,24 @@ from rest_framework import viewsets
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from djoser.serializers import SetPasswordSerializer
 from rest_framework.permissions import IsAuthenticated
 from api.paginations import ApiPagination
 from django.shortcuts import get_object_or_404
 
 from recipes.models import Follow
+from recipes.toggles import FOLLOW
 from users.models import User
-from users.serializers import FollowSerializer, UserSerializer
+from users.serializers import (FollowSerializer, UserSerializer,
+                               recipes_limit)
 from api.permissions import IsCurrentUserOrAdminOrReadOnly
+from api.membership import invalidate_membership
+from api.mixins import MetricsMixin
+from api.services import recipes_by_author
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(MetricsMixin, viewsets.ModelViewSet):
     """Viewset для пользователя / подписок."""
     queryset = User.objects.all()
     permission_classes = (IsCurrentUserOrAdminOrReadOnly, )
@@ -26,7 +32,7 @@ class UserViewSet(viewsets.ModelViewSet):
     def me(self, request):
         """Кастомное получение профиля пользователя."""
         user = self.request.user
-        serializer = UserSerializer(user, context={'request': request})
+        serializer = self.get_serializer(user)
         return Response(serializer.data)
 
     @action(["post"],
@@ -42,7 +48,7 @@ class UserViewSet(viewsets.ModelViewSet):
             context={'request': request})
         if serializer.is_valid(raise_exception=True):
             self.request.user.set_password(serializer.data["new_password"])
-            self.request.user.save()
+            self.request.user.save(update_fields=['password'])
             return Response('Пароль успешно изменен',
                             status=status.HTTP_204_NO_CONTENT)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -51,21 +57,30 @@ class UserViewSet(viewsets.ModelViewSet):
             methods=['post', 'delete'],
             permission_classes=[IsAuthenticated])
     def subscribe(self, request, *args, **kwargs):
-        """Создание и удаление подписки."""
-        author = get_object_or_404(User, id=self.kwargs.get('pk'))
+        """
+        Создание и удаление подписки: исход решает один INSERT
+        или DELETE (recipes.toggles).
+        """
         user = self.request.user
         if request.method == 'POST':
+            author = get_object_or_404(User, id=self.kwargs.get('pk'))
+            if user.pk == author.pk:
+                raise ValidationError(
+                    detail='Невозможно подписаться на себя!',
+                    code=status.HTTP_400_BAD_REQUEST)
+            if not FOLLOW.add(user.pk, author.pk):
+                raise ValidationError(
+                    detail='Вы уже подписаны на этого пользователя!',
+                    code=status.HTTP_400_BAD_REQUEST)
+            invalidate_membership(request)
             serializer = FollowSerializer(
-                data=request.data,
-                context={'request': request, 'author': author})
-            if serializer.is_valid(raise_exception=True):
-                serializer.save(author=author, user=user)
-                return Response({'Подписка успешно создана': serializer.data},
-                                status=status.HTTP_201_CREATED)
-            return Response({'errors': 'Объект не найден'},
-                            status=status.HTTP_404_NOT_FOUND)
-        if Follow.objects.filter(author=author, user=user).exists():
-            Follow.objects.get(author=author).delete()
+                Follow(user=user, author=author),
+                context={'request': request})
+            return Response({'Подписка успешно создана': serializer.data},
+                            status=status.HTTP_201_CREATED)
+        pk = self.kwargs.get('pk')
+        if pk.isdigit() and FOLLOW.remove(user.pk, int(pk)):
+            invalidate_membership(request)
             return Response('Успешная отписка',
                             status=status.HTTP_204_NO_CONTENT)
         return Response({'errors': 'Объект не найден'},
@@ -75,10 +90,20 @@ class UserViewSet(viewsets.ModelViewSet):
             methods=['get'],
             permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
-        """Отображает все подписки пользователя."""
-        follows = Follow.objects.filter(user=self.request.user)
+        """
+        Отображает все подписки пользователя.
+        Авторы со счётчиком рецептов - одним запросом, рецепты всех
+        авторов страницы - вторым.
+        """
+        follows = Follow.objects.filter(
+            user=self.request.user
+        ).select_related('author').order_by('-id')
         pages = self.paginate_queryset(follows)
-        serializer = FollowSerializer(pages,
-                                      many=True,
-                                      context={'request': request})
+        grouped = recipes_by_author(
+            [follow.author_id for follow in pages], recipes_limit(request))
+        serializer = self.instrument_serializer(
+            FollowSerializer(pages,
+                             many=True,
+                             context={'request': request,
+                                      'recipes_by_author': grouped}))
         return self.get_paginated_response(serializer.data)